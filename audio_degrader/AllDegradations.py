@@ -10,11 +10,13 @@ from .DegradationResample import DegradationResample
 from .DegradationSpeed import DegradationSpeed
 from .DegradationTimeStretching import DegradationTimeStretching
 from .DegradationTrim import DegradationTrim
+from .DegradationTrimSegment import DegradationTrimSegment
 from .DegradationEqualization import DegradationEqualization
 
 
 ALL_DEGRADATIONS = {
     DegradationTrim.name: DegradationTrim,
+    DegradationTrimSegment.name: DegradationTrimSegment,
     DegradationMp3.name: DegradationMp3,
     DegradationGain.name: DegradationGain,
     DegradationNormalization.name: DegradationNormalization,
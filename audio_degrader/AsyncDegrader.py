@@ -0,0 +1,216 @@
+import asyncio
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
+from . import Profiler
+from .AudioFile import AudioFile
+from .ChainPlanner import ChainPlanner
+from .ParametersParser import ParametersParser
+from .utils import get_raw_format_args, raw_to_samples, samples_to_raw
+
+
+class AsyncDegrader(object):
+    """ Apply degradations from asyncio code without blocking the event loop
+
+    sox-based steps run as asyncio subprocesses, and steps computed with
+    NumPy (and decoding with soundfile) run in a bounded pool of threads.
+    At most max_concurrent requests are processed at once, and requests
+    waiting for a slot are limited to max_pending (backpressure, see
+    is_full).
+
+    Cancelling a request kills its running sox process. A step running in
+    the pool of threads cannot be interrupted: it finishes and its result
+    is discarded.
+    """
+
+    def __init__(self, max_concurrent=4, max_pending=64, tmp_dir='./',
+                 num_threads=None, keep_channels=False):
+        """
+        Args:
+            max_concurrent (int): Requests processed at once, which is also
+                the number of threads of NumPy steps
+            max_pending (int): Requests waiting for a slot before new
+                requests are rejected
+            tmp_dir (string): Directory for temporary files, if needed
+            num_threads (int): Threads of each heavy degradation (see
+                ParallelExecutor)
+            keep_channels (bool): Keep the channels of inputs instead of
+                converting them to stereo (see AudioFile)
+        """
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.tmp_dir = tmp_dir
+        self.num_threads = num_threads
+        self.keep_channels = keep_channels
+        self.n_pending = 0
+        self.n_running = 0
+        self._executor = ThreadPoolExecutor(
+            max_concurrent, thread_name_prefix='audio_degrader_async')
+        self._semaphore = None
+
+    def is_full(self):
+        """ Check if new requests would be rejected
+        """
+        return self.n_pending >= self.max_pending
+
+    async def _run_in_executor(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args)
+
+    async def _run_sox(self, args, input_bytes=None):
+        """ Run sox as an asyncio subprocess (see utils.run_sox_pipe)
+
+        The process is killed if the calling task is cancelled.
+        """
+        cmd = [str(arg) for arg in args]
+        logging.debug('sox ' + ' '.join(cmd))
+        process = await asyncio.create_subprocess_exec(
+            'sox', *cmd,
+            stdin=(asyncio.subprocess.DEVNULL if input_bytes is None
+                   else asyncio.subprocess.PIPE),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        try:
+            out, err = await process.communicate(input_bytes)
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise Exception("Error running sox %s: %s" %
+                            (' '.join(cmd), err.decode(errors='replace')))
+        return out
+
+    async def _read(self, audio, sample_rate=None):
+        """ Get samples and sample rate of any input
+
+        Args:
+            audio (string, bytes or np.array): Path, contents of an audio
+                file, or samples with shape (n_channels, nsamples)
+            sample_rate (int): Sample rate of samples, if audio is np.array
+        Returns:
+            (np.array, int): Samples and sample rate
+        """
+        if isinstance(audio, np.ndarray):
+            if sample_rate is None:
+                raise Exception("sample_rate is needed with samples")
+            return audio, sample_rate
+        source = io.BytesIO(audio) if isinstance(audio, bytes) else audio
+        try:
+            samples, sample_rate = await self._run_in_executor(
+                lambda: sf.read(source, always_2d=True))
+            return samples.T, sample_rate
+        except RuntimeError:
+            if isinstance(audio, bytes):
+                raise
+        # Formats not supported by soundfile are decoded by sox
+        info = await self._run_sox(['--i', '-r', audio])
+        sample_rate = int(info.decode().strip())
+        n_channels = 2
+        if self.keep_channels:
+            info = await self._run_sox(['--i', '-c', audio])
+            n_channels = int(info.decode().strip())
+        raw = await self._run_sox([audio] +
+                                  get_raw_format_args(sample_rate,
+                                                      n_channels) + ['-'])
+        return raw_to_samples(raw, n_channels), sample_rate
+
+    async def _apply_sox(self, audio_file, degradation):
+        """ Apply a sox-based degradation with an asyncio subprocess
+        """
+        effects, sample_rate = degradation.get_sox_effects(
+            audio_file.sample_rate)
+        stage_profile = Profiler.StageProfile(
+            degradation.name,
+            dict(getattr(degradation, 'parameters_values', {})))
+        audio_file.profile.stages.append(stage_profile)
+        start = time.time()
+        n_channels = audio_file.samples.shape[0]
+        raw = await self._run_sox(
+            get_raw_format_args(audio_file.sample_rate, n_channels) + ['-'] +
+            get_raw_format_args(sample_rate, n_channels) + ['-'] + effects,
+            samples_to_raw(audio_file.samples))
+        stage_profile.wall_time = time.time() - start
+        stage_profile.subprocess_count = 1
+        stage_profile.subprocess_time = stage_profile.wall_time
+        audio_file.applied_degradations.append(degradation)
+        audio_file.samples = raw_to_samples(raw, n_channels,
+                                            audio_file.samples.dtype)
+        audio_file.sample_rate = sample_rate
+
+    async def degrade(self, audio, degradations, sample_rate=None):
+        """ Apply a chain of degradations
+
+        Args:
+            audio (string, bytes or np.array): Path, contents of an audio
+                file, or samples with shape (n_channels, nsamples)
+            degradations (list): Degradations arguments (e.g. "gain,6") or
+                Degradation objects
+            sample_rate (int): Sample rate of samples, if audio is np.array
+        Returns:
+            (AudioFile): Result, with samples, sample_rate and profile
+        """
+        if self.is_full():
+            raise Exception("Too many pending requests (%d)" %
+                            self.n_pending)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        degradations = ChainPlanner.plan([
+            ParametersParser.parse_degradation_args(d)
+            if isinstance(d, str) else d
+            for d in degradations])
+        self.n_pending += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.n_pending -= 1
+        self.n_running += 1
+        try:
+            samples, sample_rate = await self._read(audio, sample_rate)
+            audio_file = AudioFile.from_array(
+                samples, sample_rate, self.tmp_dir, in_place=True,
+                num_threads=self.num_threads,
+                keep_channels=self.keep_channels)
+            try:
+                for degradation in degradations:
+                    if degradation.get_sox_effects(
+                            audio_file.sample_rate) is not None:
+                        await self._apply_sox(audio_file, degradation)
+                    else:
+                        await self._run_in_executor(
+                            audio_file.apply_degradation, degradation)
+            finally:
+                audio_file.delete_tmp_files()
+            return audio_file
+        finally:
+            self.n_running -= 1
+            self._semaphore.release()
+
+    async def degrade_to_bytes(self, audio, degradations, sample_rate=None,
+                               output_format='WAV', subtype='PCM_16'):
+        """ Apply a chain of degradations and encode the result
+
+        Args:
+            audio, degradations, sample_rate: See degrade
+            output_format (string): Format of soundfile, e.g. WAV or FLAC
+            subtype (string): Subtype of soundfile, e.g. PCM_16 or FLOAT
+        Returns:
+            (bytes): Contents of the output file
+        """
+        audio_file = await self.degrade(audio, degradations, sample_rate)
+
+        def encode():
+            output = io.BytesIO()
+            sf.write(output, audio_file.samples.T, audio_file.sample_rate,
+                     format=output_format, subtype=subtype)
+            return output.getvalue()
+
+        return await self._run_in_executor(encode)
+
+    def shutdown(self):
+        """ Stop the pool of threads once running steps finish
+        """
+        self._executor.shutdown(wait=True)
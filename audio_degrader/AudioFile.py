@@ -1,67 +1,546 @@
+import copy
 import logging
 import os
+import shutil
+import time
 import uuid
+import numpy as np
 import sox
 import soundfile as sf
+from . import Profiler
+from .ParallelExecutor import ParallelExecutor
+from .PolyphaseResampler import PolyphaseResampler
+from .utils import build_sox, write_float_wav_header
 
 
 class AudioFile(object):
     """ This class provides all needed methods to interact with an audio file
+
+    Samples have shape (n_channels, nsamples) and are mirrored in a wav file
+    in tmp_dir, read by degradations that call sox. See the README for the
+    memory, precision and threading options.
+    """
+    decoder = None
+    """ string: soundfile, sox, or None to use soundfile if it can read the
+    input
     """
-    def __init__(self, audio_path, tmp_dir='./'):
-        basename = os.path.basename(audio_path)
+    mapped_data_offset = 64
+    """ int: Position of samples in mapped mirror files [bytes], aligned
+    for float64
+    """
+
+    def __init__(self, audio_path, tmp_dir='./', in_memory=False,
+                 dtype='float64', in_place=False, num_threads=None,
+                 keep_channels=False, memmap=False):
+        """
+        Args:
+            audio_path (string): Input audio file or URL
+            tmp_dir (string): Directory of the mirror file
+            in_memory (bool): Only write the mirror file when a degradation
+                reads it
+            dtype (string): dtype of samples, float64 or float32
+            in_place (bool): Let degradations overwrite samples
+            num_threads (int): Threads for heavy degradations (default:
+                AUDIO_DEGRADER_NUM_THREADS, or 1)
+            keep_channels (bool): Keep the channels of the input instead of
+                converting it to stereo
+            memmap (bool): Map samples from a float wav mirror file, for
+                inputs larger than memory
+        """
+        if memmap and np.dtype(dtype).kind != 'f':
+            raise Exception("memmap needs float32 or float64 samples")
+        self._init_attributes(audio_path, tmp_dir, in_memory, dtype,
+                              in_place, num_threads, keep_channels, memmap)
+        with self.profile.stage('load'):
+            decoder = self.decoder
+            if decoder is None:
+                decoder = 'soundfile' if self.can_read_natively() else 'sox'
+            if memmap:
+                self._load_mapped(decoder)
+            elif decoder == 'soundfile' and in_memory:
+                self._defer_decoding()
+            elif decoder == 'soundfile':
+                self._read_natively()
+                self.sync_mirror_file()
+            else:
+                self._create_tmp_mirror_file()
+            if self._samples is not None:
+                Profiler.record_buffer(self._samples)
+
+    def _init_attributes(self, audio_path, tmp_dir, in_memory, dtype,
+                         in_place, num_threads, keep_channels=False,
+                         memmap=False):
         self.tmp_dir = tmp_dir
+        self.in_memory = in_memory
+        self.dtype = dtype
+        self.in_place = in_place
+        self.keep_channels = keep_channels
+        self.memmap = memmap
+        self.executor = ParallelExecutor(num_threads)
         self.applied_degradations = []
         self.audio_path = audio_path
-        if not os.path.isdir(tmp_dir):
-            os.makedirs(tmp_dir)
-        self.tmp_path = os.path.join(tmp_dir,
-                                     (basename + '__tmp__' +
-                                      str(uuid.uuid4()) + '.wav'))
+        self.tmp_path = self._get_new_tmp_path()
         self.tmp_path_extra = self.tmp_path + '.extra.wav'
-        self._create_tmp_mirror_file()
+        self._mirror_file_outdated = False
+        self._samples_from_file = False
+        self._mapping = None
+        self._owns_mapping = False
+        self._samples = None
+        self._trim = None
+        self._n_input_frames = 0
+        self.profile = Profiler.ChainProfile()
+
+    @property
+    def samples(self):
+        """ np.array: Samples with shape (n_channels, nsamples). Pending
+        trims are resolved first, decoding the input if needed
+        """
+        if self._trim is not None:
+            self._resolve_trim()
+        return self._samples
+
+    @samples.setter
+    def samples(self, samples):
+        self._samples = samples
+        self._trim = None
+
+    def _get_new_tmp_path(self):
+        basename = os.path.basename(self.audio_path or 'array')
+        return os.path.join(self.tmp_dir, (basename + '__tmp__' +
+                                           str(uuid.uuid4()) + '.wav'))
+
+    @classmethod
+    def from_array(cls, samples, sample_rate, tmp_dir='./', in_memory=True,
+                   dtype=None, in_place=False, num_threads=None,
+                   keep_channels=False):
+        """ Create an AudioFile from samples in memory
+
+        Samples are not copied if they already have the right dtype and
+        shape. They are never modified, even with in_place=True.
+
+        Args:
+            samples (np.array): Samples with shape (n_channels, nsamples),
+                with 1 or 2 channels (any with keep_channels), or
+                (nsamples,) for mono. Mono is converted to stereo, as done
+                for files, unless keep_channels is set
+            sample_rate (int): Sample rate [Hz]
+            tmp_dir (string): Directory for temporary files, if needed
+            in_memory (bool): See AudioFile
+            dtype (string): Data type of samples (default: the one of
+                samples if it is floating point, float64 otherwise)
+            in_place (bool): See AudioFile
+            num_threads (int): See AudioFile
+            keep_channels (bool): See AudioFile
+        Returns:
+            (AudioFile): New AudioFile
+        """
+        samples = np.asarray(samples)
+        if dtype is None:
+            dtype = (samples.dtype if samples.dtype.kind == 'f'
+                     else np.dtype('float64'))
+        converted = samples.astype(dtype, copy=False)
+        if converted is samples:
+            # Read-only view: the array of the caller is never modified
+            converted = samples.view()
+            converted.flags.writeable = False
+        samples = converted
+        if samples.ndim == 1:
+            samples = samples[np.newaxis]
+        if (samples.ndim != 2 or samples.shape[0] == 0 or
+                (not keep_channels and samples.shape[0] > 2)):
+            raise Exception("Samples must have shape (n_channels, nsamples) "
+                            "with 1 or 2 channels, not %s" %
+                            str(samples.shape))
+        if samples.shape[0] == 1 and not keep_channels:
+            samples = np.repeat(samples, 2, axis=0)
+        audio_file = cls.__new__(cls)
+        audio_file._init_attributes(None, tmp_dir, in_memory,
+                                    np.dtype(dtype).name, in_place,
+                                    num_threads, keep_channels)
+        audio_file.samples = samples
+        audio_file.sample_rate = int(sample_rate)
+        audio_file._mirror_file_outdated = True
+        return audio_file
+
+    def can_modify_samples(self):
+        """ Check if degradations can overwrite samples (see in_place)
+
+        Returns:
+            (bool): True if in_place is set and samples are writeable
+        """
+        return self.in_place and self.samples.flags.writeable
+
+    def trim(self, start, stop=None):
+        """ Keep only samples from start to stop, without copying them
+
+        The trim is only recorded: it is resolved as a view when samples
+        are used, and if the input was not decoded yet only the kept
+        samples are decoded. Consecutive trims are combined.
+
+        Args:
+            start (int): First sample kept
+            stop (int): Sample after the last one kept (default: the end).
+                Both are relative to the current samples, and are clipped
+                to them
+        """
+        if self._trim is not None:
+            offset, end = self._trim
+        else:
+            offset, end = 0, self._samples.shape[1]
+        if stop is not None:
+            end = min(offset + max(int(stop), 0), end)
+        offset = min(offset + max(int(start), 0), end)
+        self._trim = (offset, end)
+        self._mirror_file_outdated = True
+
+    def _resolve_trim(self):
+        start, stop = self._trim
+        if self._samples is None:
+            self._read_natively(start, stop)
+        else:
+            self.samples = self._samples[:, start:stop]
+
+    def to_array(self):
+        """ Get the degraded samples, without writing any file
+
+        Returns:
+            (np.array): Samples with shape (n_channels, nsamples)
+        """
+        return self.samples
+
+    def can_read_natively(self):
+        """ Check if soundfile can decode the input, probing its header
+
+        Inputs with more than 2 channels are left to sox, which mixes them
+        down to stereo, unless keep_channels is set.
+
+        Returns:
+            (bool): True if the input can be read without sox
+        """
+        try:
+            info = sf.info(self.audio_path)
+        except RuntimeError:
+            return False
+        return self.keep_channels or info.channels <= 2
+
+    def _defer_decoding(self):
+        """ Probe the input, leaving decoding to the first use of samples
+        """
+        info = sf.info(self.audio_path)
+        self.sample_rate = info.samplerate
+        self._n_input_frames = info.frames
+        self._trim = (0, info.frames)
+        self._mirror_file_outdated = True
+
+    def _read_natively(self, start=0, stop=None):
+        """ Decode the input with soundfile, without writing the mirror file
+
+        Args:
+            start (int): First frame decoded
+            stop (int): Frame after the last one decoded (default: the end)
+        """
+        size = os.path.getsize(self.audio_path)
+        if stop is not None and self._n_input_frames > 0:
+            # Only the segment is read, seeking to its start
+            size = size * (stop - start) // self._n_input_frames
+        Profiler.record_read(size)
+        samples, self.sample_rate = sf.read(self.audio_path, dtype=self.dtype,
+                                            always_2d=True, start=start,
+                                            stop=stop)
+        self.samples = samples.T
+        if self.samples.shape[0] == 1 and not self.keep_channels:
+            self.samples = np.repeat(self.samples, 2, axis=0)
+        self._mirror_file_outdated = True
+
+    def _create_mapped_mirror_file(self, n_channels, n_frames):
+        """ Create a new float wav mirror file and map its samples
+
+        The file is created aside and renamed, so arrays mapping the
+        previous mirror file (e.g. of forks) remain valid.
+
+        Args:
+            n_channels (int): Number of channels
+            n_frames (int): Number of samples per channel
+        Returns:
+            (np.memmap): Writeable samples with shape (n_frames, n_channels)
+        """
+        if not os.path.isdir(self.tmp_dir):
+            os.makedirs(self.tmp_dir)
+        dtype = np.dtype(self.dtype).newbyteorder('<')
+        new_path = self.tmp_path + '.new'
+        with open(new_path, 'wb') as f:
+            write_float_wav_header(f, self.sample_rate, n_channels, n_frames,
+                                   dtype, self.mapped_data_offset)
+            f.truncate(self.mapped_data_offset +
+                       n_frames * n_channels * dtype.itemsize)
+        os.replace(new_path, self.tmp_path)
+        self._mapping = np.memmap(self.tmp_path, dtype=dtype, mode='r+',
+                                  offset=self.mapped_data_offset,
+                                  shape=(n_frames, n_channels))
+        self._owns_mapping = True
+        return self._mapping
+
+    def _load_mapped(self, decoder):
+        """ Decode the input block by block into a mapped mirror file
+        """
+        path = self.audio_path
+        if decoder != 'soundfile':
+            if not os.path.isdir(self.tmp_dir):
+                os.makedirs(self.tmp_dir)
+            tfm = sox.Transformer()
+            tfm.convert(n_channels=None if self.keep_channels else 2,
+                        bitdepth=32)
+            build_sox(tfm, self.audio_path, self.tmp_path_extra)
+            path = self.tmp_path_extra
+        Profiler.record_read(os.path.getsize(path))
+        with sf.SoundFile(path) as f:
+            self.sample_rate = f.samplerate
+            n_channels = f.channels if self.keep_channels else 2
+            mapping = self._create_mapped_mirror_file(n_channels, f.frames)
+            start = 0
+            for block in f.blocks(blocksize=65536, dtype=self.dtype,
+                                  always_2d=True):
+                mapping[start:start + len(block)] = block
+                start += len(block)
+        mapping.flush()
+        Profiler.record_write(os.path.getsize(self.tmp_path))
+        if path != self.audio_path:
+            os.remove(path)
+        self.samples = mapping.T
+        self._mirror_file_outdated = False
+
+    def _get_mapped_frames(self):
+        """ Locate samples in the mapped mirror file, if they are a view of
+        consecutive frames of it (e.g. after trim_from or gain in place)
+
+        Returns:
+            (int, int): First frame and number of frames, or None
+        """
+        mapping = self._mapping
+        samples = self.samples
+        if (not self._owns_mapping or
+                not np.may_share_memory(samples, mapping) or
+                samples.shape[0] != mapping.shape[1] or
+                samples.strides != mapping.T.strides):
+            return None
+        offset = (samples.__array_interface__['data'][0] -
+                  mapping.__array_interface__['data'][0])
+        block_align = mapping.strides[0]
+        if offset < 0 or offset % block_align:
+            return None
+        return offset // block_align, samples.shape[1]
+
+    def _update_mapped_mirror_file(self):
+        """ Make the mapped mirror file hold exactly samples
+
+        If samples are a view of the mapped file only its header is patched,
+        otherwise they are written into a new mapped file.
+        """
+        frames = self._get_mapped_frames()
+        if frames is not None:
+            start, n_frames = frames
+            self._mapping.flush()
+            with open(self.tmp_path, 'r+b') as f:
+                write_float_wav_header(
+                    f, self.sample_rate, self.samples.shape[0], n_frames,
+                    self._mapping.dtype, (self.mapped_data_offset +
+                                          start * self._mapping.strides[0]))
+            return
+        samples = self.samples
+        mapping = self._create_mapped_mirror_file(*samples.shape)
+        mapping[:] = samples.T
+        mapping.flush()
+        self.samples = mapping.T
+        Profiler.record_write(os.path.getsize(self.tmp_path))
+
+    def _export_mapped(self, output_path):
+        """ Export the mapped mirror file by patching its header and moving
+        it to output_path, without writing samples again
+
+        Samples then map output_path, so they are set read-only.
+        """
+        self._mirror_file_outdated = True
+        self.sync_mirror_file()
+        start, n_frames = self._get_mapped_frames()
+        block_align = self._mapping.strides[0]
+        os.truncate(self.tmp_path, (self.mapped_data_offset +
+                                    (start + n_frames) * block_align))
+        try:
+            os.replace(self.tmp_path, output_path)
+        except OSError:
+            # e.g. tmp_dir in another file system
+            shutil.copyfile(self.tmp_path, output_path)
+            os.remove(self.tmp_path)
+        self.samples.flags.writeable = False
+        self._mapping = None
+        self._owns_mapping = False
+        self._mirror_file_outdated = True
 
     def _create_tmp_mirror_file(self):
+        if not os.path.isdir(self.tmp_dir):
+            os.makedirs(self.tmp_dir)
         tfm = sox.Transformer()
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(self.audio_path, self.tmp_path)
-        self.samples, self.sample_rate = sf.read(self.tmp_path)
+        tfm.convert(n_channels=None if self.keep_channels else 2,
+                    bitdepth=32)
+        build_sox(tfm, self.audio_path, self.tmp_path)
+        Profiler.record_read(os.path.getsize(self.tmp_path))
+        self.samples, self.sample_rate = sf.read(self.tmp_path,
+                                                 dtype=self.dtype,
+                                                 always_2d=True)
         self.samples = self.samples.T
 
+    def fork(self, samples=None, degradation=None):
+        """ Create a copy that can be degraded independently
+
+        No audio is decoded or copied: samples are shared and set read-only,
+        which is safe because degradations replace samples instead of
+        modifying them. The fork has its own mirror file, written only when
+        needed, and a copy of applied_degradations and profile stages.
+
+        Args:
+            samples (np.array): Samples of the fork (default: the ones of
+                this AudioFile)
+            degradation (Degradation): Degradation that produced samples,
+                appended to applied_degradations of the fork
+        Returns:
+            (AudioFile): New AudioFile
+        """
+        if samples is None:
+            samples = self.samples
+        samples.flags.writeable = False
+        # Headers of a mapped file shared with forks are never patched
+        self._owns_mapping = False
+        fork = copy.copy(self)
+        fork.samples = samples
+        fork.applied_degradations = list(self.applied_degradations)
+        if degradation is not None:
+            fork.applied_degradations.append(degradation)
+        fork.tmp_path = self._get_new_tmp_path()
+        fork.tmp_path_extra = fork.tmp_path + '.extra.wav'
+        fork._mirror_file_outdated = True
+        fork._samples_from_file = False
+        fork.profile = Profiler.ChainProfile()
+        fork.profile.stages = list(self.profile.stages)
+        return fork
+
     def apply_degradation(self, degradation):
         self.applied_degradations.append(degradation)
         logging.debug("Applying {0} degradation".format(degradation))
-        degradation.apply(self)
-        self._update_mirror_file()
+        with self.profile.stage(degradation.name,
+                                dict(getattr(degradation,
+                                             'parameters_values', {}))):
+            if self._samples is not None:
+                Profiler.record_buffer(self._samples)
+            if degradation.requires_mirror_file:
+                self.sync_mirror_file()
+            self._samples_from_file = False
+            degradation.apply(self)
+            if not self._samples_from_file:
+                self._mirror_file_outdated = True
+            if not self.in_memory:
+                self.sync_mirror_file()
+            if self._samples is not None:
+                Profiler.record_buffer(self._samples)
+
+    def sync_mirror_file(self):
+        """ Write samples to the mirror file only if it is outdated
+        """
+        if self._mirror_file_outdated:
+            self._update_mirror_file()
+
+    def set_samples(self, samples, sample_rate):
+        """ Replace samples with ones computed elsewhere (e.g. cached)
+
+        Args:
+            samples (np.array): Samples with shape (n_channels, nsamples)
+            sample_rate (int): Sample rate of samples [Hz]
+        """
+        self.samples = samples
+        self.sample_rate = int(sample_rate)
+        self._mirror_file_outdated = True
+        if not self.in_memory:
+            self.sync_mirror_file()
+
+    def set_samples_from_file(self, path):
+        """ Read samples from a file written by an external tool
+
+        The file replaces the mirror file, so a following disk-based
+        degradation can read it without writing samples again.
+
+        Args:
+            path (string): Path of a wav file in tmp_dir
+        """
+        Profiler.record_read(os.path.getsize(path))
+        self.samples, self.sample_rate = sf.read(path, dtype=self.dtype,
+                                                 always_2d=True)
+        self.samples = self.samples.T
+        os.replace(path, self.tmp_path)
+        self._mirror_file_outdated = False
+        self._samples_from_file = True
+        self._owns_mapping = False
 
     def _update_mirror_file(self):
         logging.debug("Updating mirror file")
-        wav = self.samples
-        if wav.ndim > 1 and wav.shape[0] == 2:
-            wav = wav.T
-        sf.write(self.tmp_path, wav,  self.sample_rate)
+        start = time.time()
+        if self.memmap:
+            self._update_mapped_mirror_file()
+        else:
+            if not os.path.isdir(self.tmp_dir):
+                os.makedirs(self.tmp_dir)
+            sf.write(self.tmp_path, self.samples.T, self.sample_rate)
+            Profiler.record_write(os.path.getsize(self.tmp_path))
+        self._mirror_file_outdated = False
+        Profiler.record_mirror_update(time.time() - start)
 
-    def to_wav(self, output_path):
-        tfm = sox.Transformer()
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(self.tmp_path, output_path)
+    def to_wav(self, output_path, subtype=None):
+        """ Export samples to a wav file
+
+        Args:
+            output_path (string): Path of output wav file
+            subtype (string): Subtype of soundfile, e.g. PCM_16 or FLOAT.
+                By default samples are converted by sox into 32 bits, and
+                into stereo unless keep_channels is set. Otherwise they are
+                written directly, without the mirror file. With memmap, the
+                mirror file itself is moved to output_path by default (FLOAT
+                or DOUBLE)
+        """
+        with self.profile.stage('export'):
+            mapped_subtype = {4: 'FLOAT', 8: 'DOUBLE'}.get(
+                self.samples.itemsize)
+            if self.memmap and subtype in (None, mapped_subtype):
+                self._export_mapped(output_path)
+                return
+            if subtype is None and not self.keep_channels:
+                self.sync_mirror_file()
+                tfm = sox.Transformer()
+                tfm.convert(n_channels=2, bitdepth=32)
+                build_sox(tfm, self.tmp_path, output_path)
+                return
+            sf.write(output_path, self.samples.T, self.sample_rate,
+                     subtype=subtype or 'PCM_32')
+            Profiler.record_write(os.path.getsize(output_path))
 
     def delete_tmp_files(self):
-        logging.debug("Deleting %s" % self.tmp_path)
-        os.remove(self.tmp_path)
+        if os.path.isfile(self.tmp_path):
+            logging.debug("Deleting %s" % self.tmp_path)
+            os.remove(self.tmp_path)
         if os.path.isfile(self.tmp_path_extra):
             logging.debug("Deleting %s" % self.tmp_path_extra)
             os.remove(self.tmp_path_extra)
-        if os.listdir(self.tmp_dir) == []:
+        if os.path.isdir(self.tmp_dir) and os.listdir(self.tmp_dir) == []:
             logging.debug("Deleting empty directory %s" % self.tmp_dir)
             os.rmdir(self.tmp_dir)
 
-    def resample(self, new_sample_rate):
-        tfm = sox.Transformer()
-        tfm.rate(new_sample_rate)
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(self.tmp_path, self.tmp_path_extra)
+    def resample(self, new_sample_rate, quality='high'):
+        """ Resample in memory with a native polyphase filter
 
-        self.samples, self.sample_rate = sf.read(self.tmp_path_extra)
-        self.samples = self.samples.T
-        self._update_mirror_file()
+        Args:
+            new_sample_rate (int): Desired sample rate [Hz]
+            quality (string): low, medium or high (see
+                PolyphaseResampler.qualities)
+        """
+        self.samples = PolyphaseResampler.resample_signal(
+            self.samples, self.sample_rate, new_sample_rate, quality,
+            self.executor)
+        self.sample_rate = new_sample_rate
+        self._mirror_file_outdated = True
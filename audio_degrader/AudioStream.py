@@ -0,0 +1,138 @@
+import logging
+import os
+import uuid
+import numpy as np
+import sox
+import soundfile as sf
+
+
+class AudioStream(object):
+    """ Apply degradations to an audio file block by block
+
+    Blocks of block_size samples are read with soundfile, passed through
+    the whole chain of degradations and written to the output file, so peak
+    memory does not depend on the duration of the input. All degradations
+    must be streamable (see Degradation.streamable). Degradations needing
+    statistics of their whole input (see Degradation.needs_prepass) get an
+    extra pass over the chain up to them.
+
+    As with AudioFile, output is stereo with 32 bits per sample by default;
+    keep_channels and subtype keep the channels of the input and choose the
+    subtype of the output.
+    """
+
+    def __init__(self, audio_path, tmp_dir='./', block_size=65536,
+                 dtype='float64', keep_channels=False, subtype='PCM_32'):
+        """
+        Args:
+            audio_path (string): Path of input audio (any format)
+            tmp_dir (string): Directory for temporary files, only used if
+                input must be decoded with sox
+            block_size (int): Samples read per block
+            dtype (string): Data type of processed samples
+            keep_channels (bool): Keep the channels of input instead of
+                converting it to stereo
+            subtype (string): Subtype of soundfile of output, e.g. PCM_16
+        """
+        self.audio_path = audio_path
+        self.tmp_dir = tmp_dir
+        self.block_size = block_size
+        self.dtype = dtype
+        self.keep_channels = keep_channels
+        self.subtype = subtype
+
+    def _get_readable_path(self):
+        """ Get path of a file that can be read in blocks by soundfile
+
+        Inputs not supported by soundfile, or with more than 2 channels
+        (unless keep_channels is set), are converted into a temporary wav
+        file with sox.
+
+        Returns:
+            (string, bool): Path and True if it is a temporary file
+        """
+        try:
+            if (self.keep_channels or
+                    sf.info(self.audio_path).channels <= 2):
+                return self.audio_path, False
+        except RuntimeError:
+            pass
+        if not os.path.isdir(self.tmp_dir):
+            os.makedirs(self.tmp_dir)
+        tmp_path = os.path.join(self.tmp_dir,
+                                (os.path.basename(self.audio_path) +
+                                 '__tmp__' + str(uuid.uuid4()) + '.wav'))
+        tfm = sox.Transformer()
+        tfm.convert(n_channels=None if self.keep_channels else 2,
+                    bitdepth=32)
+        tfm.build(self.audio_path, tmp_path)
+        return tmp_path, True
+
+    def _blocks(self, path):
+        for block in sf.blocks(path, blocksize=self.block_size,
+                               always_2d=True, dtype=self.dtype):
+            block = block.T
+            if block.shape[0] == 1 and not self.keep_channels:
+                block = np.repeat(block, 2, axis=0)
+            yield block
+
+    @staticmethod
+    def _start(degradations, sample_rate, n_channels):
+        for degradation in degradations:
+            sample_rate = degradation.start_stream(sample_rate, n_channels)
+        return sample_rate
+
+    @staticmethod
+    def _push(degradations, block, sink):
+        for degradation in degradations:
+            if block.shape[1] == 0:
+                return
+            block = degradation.process_block(block)
+        if block.shape[1] > 0:
+            sink(block)
+
+    def _run(self, path, degradations, sink):
+        """ Pass all blocks through started degradations into sink
+        """
+        for block in self._blocks(path):
+            self._push(degradations, block, sink)
+        for i, degradation in enumerate(degradations):
+            block = degradation.end_stream()
+            if block is not None:
+                self._push(degradations[i + 1:], block, sink)
+
+    def apply_degradations(self, degradations, output_path):
+        """ Apply a sequence of degradations and write the result
+
+        Args:
+            degradations (list of Degradation): Degradations to be applied
+            output_path (string): Path of output wav file
+        """
+        not_streamable = [d.name for d in degradations if not d.streamable]
+        if not_streamable:
+            raise Exception("Degradations %s cannot be streamed" %
+                            ', '.join(not_streamable))
+        path, is_tmp = self._get_readable_path()
+        try:
+            info = sf.info(path)
+            sample_rate = info.samplerate
+            n_channels = info.channels if self.keep_channels else 2
+            for i, degradation in enumerate(degradations):
+                if degradation.needs_prepass:
+                    logging.debug("Prepass for {0}".format(degradation))
+                    degradation.start_prepass(
+                        self._start(degradations[:i], sample_rate,
+                                    n_channels), n_channels)
+                    self._run(path, degradations[:i],
+                              degradation.prepass_block)
+            output_sample_rate = self._start(degradations, sample_rate,
+                                             n_channels)
+            with sf.SoundFile(output_path, 'w',
+                              samplerate=output_sample_rate,
+                              channels=n_channels,
+                              subtype=self.subtype) as f:
+                self._run(path, degradations,
+                          lambda block: f.write(np.clip(block, -1.0, 1.0).T))
+        finally:
+            if is_tmp:
+                os.remove(path)
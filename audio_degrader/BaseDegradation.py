@@ -15,6 +15,22 @@ class Degradation(object):
     The list contains tuples with the following info:
         [(param_name, example_value, description),...]
     """
+    requires_mirror_file = False
+    """ bool: True if apply reads the mirror file (audio_file.tmp_path)
+    instead of audio_file.samples, e.g. degradations running sox on it
+    """
+    streamable = False
+    """ bool: True if it implements start_stream, process_block and
+    end_stream, so it can be applied block by block (see AudioStream)
+    """
+    needs_prepass = False
+    """ bool: True if streaming needs a first pass over the whole input to
+    get some statistics (see start_prepass and prepass_block)
+    """
+    stack_parameters = []
+    """ list: Names of numeric parameters that can differ between
+    degradations applied at once to the same input (see apply_stacked)
+    """
 
     def __str__(self):
         return self.name
@@ -24,6 +40,24 @@ class Degradation(object):
         """
         self.parameters_values = parameters_values
 
+    def has_random_values(self):
+        """ Check if some parameters are drawn when applied, so results
+        cannot be reproduced (see sample_random_values)
+        """
+        return False
+
+    def sample_random_values(self, rng):
+        """ Get an equivalent degradation whose random parameters (e.g.
+        offset random of mix) are replaced by values drawn from rng
+
+        Args:
+            rng (np.random.RandomState): Random generator
+        Returns:
+            (Degradation): This degradation if it has no random parameters,
+                or a new one
+        """
+        return self
+
     @abstractmethod
     def apply(self, audio_file):
         """ Process audio_file.samples field
@@ -33,6 +67,81 @@ class Degradation(object):
         """
         pass
 
+    def apply_stacked(self, audio_file, degradations):
+        """ Apply several degradations to the same input at once
+
+        Only implemented by degradations with stack_parameters. All given
+        degradations have the same class and differ only in those parameters.
+
+        Args:
+            audio_file (AudioFile): Input audio (not modified)
+            degradations (list of Degradation): Degradations to be applied
+        Returns:
+            (np.array): Outputs with shape (len(degradations), n_channels,
+                nsamples)
+        """
+        raise Exception("Degradation %s cannot be stacked" % self.name)
+
+    def get_sox_effects(self, sample_rate):
+        """ Get the sox effects applied by this degradation, if any
+
+        Adjacent degradations implemented with sox are fused into a single
+        sox process by ChainPlanner.
+
+        Args:
+            sample_rate (int): Sample rate of input
+        Returns:
+            (list of string, int): sox effects and sample rate of their
+                output, or None if it is not implemented with sox
+        """
+        return None
+
+    def start_prepass(self, sample_rate, n_channels):
+        """ Reset statistics before a prepass over the whole input
+
+        Args:
+            sample_rate (int): Sample rate of input blocks
+            n_channels (int): Number of channels of input blocks
+        """
+        pass
+
+    def prepass_block(self, samples):
+        """ Update statistics with the next block of input
+
+        Args:
+            samples (np.array): Next block with shape (n_channels, n)
+        """
+        pass
+
+    def start_stream(self, sample_rate, n_channels):
+        """ Reset the state before processing a stream block by block
+
+        Args:
+            sample_rate (int): Sample rate of input blocks
+            n_channels (int): Number of channels of input blocks
+        Returns:
+            (int): Sample rate of output blocks
+        """
+        return sample_rate
+
+    def process_block(self, samples):
+        """ Process the next block of a stream
+
+        Args:
+            samples (np.array): Next block with shape (n_channels, n)
+        Returns:
+            (np.array): Next output block. Its length can differ from input
+        """
+        return samples
+
+    def end_stream(self):
+        """ Get output samples still kept in the state at the end of stream
+
+        Returns:
+            (np.array): Last output block, or None
+        """
+        return None
+
 
 class DegradationUsageDocGenerator(object):
     """ It generates documentation strings about a given degradation """
@@ -0,0 +1,234 @@
+import csv
+import glob
+import json
+import logging
+import os
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .AudioFile import AudioFile
+from .ChainPlanner import ChainPlanner
+from .ParametersParser import ParametersParser
+from .ResultCache import ResultCache
+
+
+BatchJob = namedtuple('BatchJob', ['input_path', 'output_path',
+                                   'degradations_args'])
+""" One file to process: input path, output path and degradations args """
+
+BatchResult = namedtuple('BatchResult', ['input_path', 'output_path',
+                                         'error', 'profile'])
+""" Outcome of a BatchJob. error is None if it succeeded. profile is the
+dict of the AudioFile profile (see Profiler.ChainProfile.to_dict), None if
+the input could not be loaded
+"""
+
+_worker_tmp_dir = None
+_worker_cache = None
+_worker_seed = None
+_parsed_degradations = {}
+
+
+def _init_worker(tmp_dir, cache_dir=None, cache_max_bytes=None, seed=None):
+    """ Initialize a worker process with its own temporary directory, the
+    seed of the batch and the shared result cache, if any
+    """
+    global _worker_tmp_dir, _worker_cache, _worker_seed
+    _worker_tmp_dir = os.path.join(tmp_dir, 'worker_{0}'.format(os.getpid()))
+    _worker_seed = seed
+    if cache_dir is not None:
+        _worker_cache = ResultCache(cache_dir, cache_max_bytes)
+
+
+def _get_degradations(degradations_args):
+    """ Parse and plan degradations arguments, reusing previous chains
+    """
+    key = tuple(degradations_args)
+    if key not in _parsed_degradations:
+        _parsed_degradations[key] = ChainPlanner.plan(
+            ParametersParser.parse_degradations_args(degradations_args))
+    return _parsed_degradations[key]
+
+
+def _seed_job(job_index, seed=None):
+    """ Get the random generator of a job, and reseed the global random
+    state from it
+
+    Workers inherit the random state of the parent, so random draws would
+    otherwise repeat in every worker. With a seed, each job gets the same
+    draws whatever worker runs it.
+
+    Args:
+        job_index (int): Position of the job in the batch
+        seed (int): Seed of the batch (default: fresh entropy)
+    Returns:
+        (np.random.RandomState): Generator of the job
+    """
+    rng = np.random.RandomState(None if seed is None else [seed, job_index])
+    np.random.seed(rng.randint(2 ** 32))
+    return rng
+
+
+def _process_job(job, job_index=0):
+    """ Apply the degradations of a job, reporting any error as a result
+    """
+    audio_file = None
+    profile = None
+    rng = _seed_job(job_index, _worker_seed)
+    try:
+        # Concrete random values (e.g. mix offset random), also cacheable
+        degradations = [d.sample_random_values(rng)
+                        for d in _get_degradations(job.degradations_args)]
+        audio_file = AudioFile(job.input_path, _worker_tmp_dir,
+                               in_memory=True, in_place=True)
+        if _worker_cache is not None:
+            _worker_cache.apply_degradations(audio_file, degradations)
+        else:
+            for degradation in degradations:
+                audio_file.apply_degradation(degradation)
+        output_dir = os.path.dirname(job.output_path)
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        audio_file.to_wav(job.output_path)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+        logging.error("Error processing {0}:\n{1}".format(
+            job.input_path, error))
+    finally:
+        if audio_file is not None:
+            audio_file.delete_tmp_files()
+            profile = audio_file.profile.to_dict()
+    return BatchResult(job.input_path, job.output_path, error, profile)
+
+
+class BatchDegrader(object):
+    """ Apply degradations to many files using a pool of processes
+
+    Each worker process keeps its parsed degradations and its own
+    temporary directory for the whole batch. With cache_dir, workers share
+    a ResultCache, so chains resume from their longest prefix already
+    computed for the same input, e.g. in a previous run.
+    """
+
+    def __init__(self, tmp_dir='./', num_workers=None, chunksize=1,
+                 cache_dir=None, cache_max_bytes=4 * 1024 * 1024 * 1024,
+                 seed=None):
+        """
+        Args:
+            tmp_dir (string): Directory for the temporary dirs of workers
+            num_workers (int): Number of processes (default: number of CPUs)
+            chunksize (int): Number of jobs sent to a worker at once
+            cache_dir (string): Directory of the result cache (default: no
+                cache)
+            cache_max_bytes (int): Maximum size of the result cache [bytes]
+            seed (int): Seed of random draws, combined with the position of
+                each job (default: fresh entropy for each job)
+        """
+        self.tmp_dir = tmp_dir
+        self.num_workers = num_workers
+        self.chunksize = chunksize
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.seed = seed
+
+    def run(self, jobs):
+        """ Process all jobs. A failing job does not abort the batch
+
+        Args:
+            jobs (list of BatchJob): Jobs to be processed
+        Returns:
+            (list of BatchResult): Result of each job, in the same order
+        """
+        with ProcessPoolExecutor(max_workers=self.num_workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.tmp_dir, self.cache_dir,
+                                           self.cache_max_bytes,
+                                           self.seed)) as executor:
+            results = list(executor.map(_process_job, jobs,
+                                        range(len(jobs)),
+                                        chunksize=self.chunksize))
+        n_errors = len([r for r in results if r.error is not None])
+        logging.info("Processed {0} files, {1} errors".format(len(results),
+                                                              n_errors))
+        return results
+
+    @staticmethod
+    def get_output_path(input_path, input_dir, output_dir):
+        """ Get output wav path mirroring input_path relative to input_dir
+        """
+        rel_path = os.path.relpath(input_path, input_dir)
+        return os.path.join(output_dir, os.path.splitext(rel_path)[0] + '.wav')
+
+    @staticmethod
+    def jobs_from_glob(pattern, output_dir, degradations_args):
+        """ Create jobs for all files matching a glob pattern
+
+        Args:
+            pattern (string): Glob pattern of input files (recursive ** ok)
+            output_dir (string): Directory of output files
+            degradations_args (list of string): Degradations to be applied
+        Returns:
+            (list of BatchJob): One job per matching file
+        """
+        input_paths = sorted(p for p in glob.glob(pattern, recursive=True)
+                             if os.path.isfile(p))
+        input_dir = os.path.commonpath(input_paths) if input_paths else ''
+        if len(input_paths) == 1:
+            input_dir = os.path.dirname(input_dir)
+        return [BatchJob(p,
+                         BatchDegrader.get_output_path(p, input_dir,
+                                                       output_dir),
+                         degradations_args)
+                for p in input_paths]
+
+    @staticmethod
+    def jobs_from_directory(input_dir, output_dir, degradations_args):
+        """ Create jobs for all files of a directory (recursively)
+
+        Args:
+            input_dir (string): Directory of input files
+            output_dir (string): Directory of output files
+            degradations_args (list of string): Degradations to be applied
+        Returns:
+            (list of BatchJob): One job per file
+        """
+        jobs = []
+        for root, dirs, fnames in os.walk(input_dir):
+            dirs.sort()
+            for fname in sorted(fnames):
+                input_path = os.path.join(root, fname)
+                jobs.append(BatchJob(
+                    input_path,
+                    BatchDegrader.get_output_path(input_path, input_dir,
+                                                  output_dir),
+                    degradations_args))
+        return jobs
+
+    @staticmethod
+    def jobs_from_manifest(manifest_path):
+        """ Create jobs from a CSV or JSONL manifest
+
+        Each row or line must define "input", "output" and "degradations".
+        Degradations are a space-separated string (e.g. "gain,6 normalize")
+        or, in JSONL manifests, also a list of strings.
+
+        Args:
+            manifest_path (string): Path of .csv or .jsonl manifest
+        Returns:
+            (list of BatchJob): One job per row
+        """
+        with open(manifest_path) as f:
+            if os.path.splitext(manifest_path)[1] == '.csv':
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+        jobs = []
+        for row in rows:
+            degradations_args = row['degradations']
+            if not isinstance(degradations_args, list):
+                degradations_args = degradations_args.split()
+            jobs.append(BatchJob(row['input'], row['output'],
+                                 degradations_args))
+        return jobs
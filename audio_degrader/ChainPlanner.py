@@ -0,0 +1,45 @@
+from .DegradationSoxChain import DegradationSoxChain
+
+
+class ChainPlanner(object):
+    """ Class able to optimize a sequence of degradations """
+
+    @staticmethod
+    def is_sox_based(degradation):
+        """ Check if a degradation can be fused with other sox effects
+
+        Args:
+            degradation (Degradation): Input degradation
+        Returns:
+            (bool): True if it is applied with a list of sox effects
+        """
+        return degradation.get_sox_effects(44100) is not None
+
+    @staticmethod
+    def plan(degradations):
+        """ Replace runs of adjacent sox-based degradations by a single one
+
+        e.g. [speed, pitch_shift, gain, time_stretch, mp3] becomes
+        [sox_chain(speed, pitch_shift), gain, time_stretch, mp3]
+
+        Args:
+            degradations (list of Degradation): Degradations, e.g. returned
+                by ParametersParser.parse_degradations_args
+        Returns:
+            (list of Degradation): Equivalent degradations
+        """
+        planned = []
+        run = []
+        for degradation in degradations + [None]:
+            if (degradation is not None and
+                    ChainPlanner.is_sox_based(degradation)):
+                run.append(degradation)
+                continue
+            if len(run) == 1:
+                planned.append(run[0])
+            elif len(run) > 1:
+                planned.append(DegradationSoxChain(run))
+            run = []
+            if degradation is not None:
+                planned.append(degradation)
+        return planned
@@ -1,10 +1,9 @@
-import soundfile as sf
 import logging
-import sox
 import numpy as np
-from scipy import signal
-import os
 from .BaseDegradation import Degradation
+from .PartitionedConvolver import PartitionedConvolver
+from .ResourceCache import RESOURCE_CACHE
+from .utils import resolve_resource_path
 
 
 class DegradationConvolution(Degradation):
@@ -18,39 +17,83 @@ class DegradationConvolution(Degradation):
         ("level",
          "1.0",
          "Wet level (0.0=dry, 1.0=wet)")]
+    streamable = True
+    block_size = 16384  # Block size of partitioned convolution [samples]
 
     def get_actual_impulse_response_path(self):
         """ Resolve full path of impulse response
 
         The specified impulse response path could be a relative path
         """
-        import audio_degrader
-        resources_dir = os.path.join(audio_degrader.__path__[0],
-                                     'resources')
-        ir_path = self.parameters_values['impulse_response']
-        ir_path_resource = os.path.join(resources_dir, ir_path)
-        if not os.path.isfile(ir_path) and os.path.isfile(ir_path_resource):
-            return ir_path_resource
-        else:
-            return ir_path
+        return resolve_resource_path(
+            self.parameters_values['impulse_response'])
+
+    def get_convolver(self, ir_path, sample_rate, dtype='float64',
+                      n_channels=2):
+        """ Get convolver with the impulse response resampled to input
+
+        Spectra of impulse response partitions are kept in RESOURCE_CACHE.
+        A mono impulse response is transformed once and broadcast to all
+        channels of input.
+
+        Args:
+            ir_path (string): Path of impulse response
+            sample_rate (int): Sample rate of input
+            dtype (string): Data type of input samples
+            n_channels (int): Number of channels of input
+        Returns:
+            (PartitionedConvolver): Convolver ready to be used
+        """
+        key = (('spectra', self.block_size) +
+               RESOURCE_CACHE.get_key(ir_path, sample_rate, n_channels,
+                                      dtype))
+        spectra = RESOURCE_CACHE.get(
+            key,
+            lambda: PartitionedConvolver.get_spectra(
+                RESOURCE_CACHE.get_resource(ir_path,
+                                            sample_rate,
+                                            n_channels,
+                                            dtype),
+                self.block_size))
+        return PartitionedConvolver(spectra, self.block_size)
 
     def apply(self, audio_file):
         ir_path = self.get_actual_impulse_response_path()
         level = float(self.parameters_values['level'])
         logging.info('Convolving with %s and level %f' % (ir_path, level))
         x = audio_file.samples
-        extra_tmp_path = audio_file.tmp_path + '.extra.wav'
-        tfm = sox.Transformer()
-        tfm.rate(audio_file.sample_rate)
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(ir_path, extra_tmp_path)
-
-        ir_x, _ = sf.read(extra_tmp_path)
-        ir_x = ir_x.T
-        os.remove(extra_tmp_path)
-        y_wet = np.zeros(x.shape)
-        for channel in [0, 1]:
-            y_wet[channel, :] = signal.fftconvolve(
-                x[channel, :], ir_x[channel, :], mode='full')[0:x.shape[1]]
-        y = y_wet * level + x * (1 - level)
+        convolver = self.get_convolver(ir_path, audio_file.sample_rate,
+                                       x.dtype, x.shape[0])
+        y = convolver.convolve(x, audio_file.executor)
+        y *= level
+        if audio_file.can_modify_samples():
+            x *= 1 - level
+            y += x
+        else:
+            y += x * (1 - level)
         audio_file.samples = y
+
+    def start_stream(self, sample_rate, n_channels):
+        self._sample_rate = sample_rate
+        self._convolver = None
+        self._dry = np.zeros((n_channels, 0))
+        return sample_rate
+
+    def _mix_wet_dry(self, y_wet):
+        level = float(self.parameters_values['level'])
+        n = y_wet.shape[1]
+        y = y_wet * level + self._dry[:, :n] * (1 - level)
+        self._dry = self._dry[:, n:]
+        return y
+
+    def process_block(self, samples):
+        if self._convolver is None:
+            self._convolver = self.get_convolver(
+                self.get_actual_impulse_response_path(), self._sample_rate,
+                samples.dtype, samples.shape[0])
+            self._dry = self._dry.astype(samples.dtype)
+        self._dry = np.concatenate((self._dry, samples), axis=1)
+        return self._mix_wet_dry(self._convolver.process(samples))
+
+    def end_stream(self):
+        return self._mix_wet_dry(self._convolver.flush())
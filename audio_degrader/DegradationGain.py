@@ -8,11 +8,34 @@ class DegradationGain(Degradation):
     name = "gain"
     description = "Apply gain expressed in dBs"
     parameters_info = [("value", "6", "Gain value [dB]")]
+    streamable = True
+    stack_parameters = ['value']
 
     def apply(self, audio_file):
         value = float(self.parameters_values["value"])
         logging.debug("Apply gain %f dB" % value)
         x = audio_file.samples
-        x = x * (10 ** (value / 20.0))  # linear value
-        x = np.minimum(np.maximum(-1.0, x), 1.0)
-        audio_file.samples = x
+        audio_file.samples = self.process_block(
+            x, x if audio_file.can_modify_samples() else None)
+
+    def apply_stacked(self, audio_file, degradations):
+        values = np.array([float(d.parameters_values["value"])
+                           for d in degradations])
+        logging.debug("Apply gains %s dB" % values)
+        x = audio_file.samples
+        gains = (10 ** (values / 20.0)).astype(x.dtype)
+        y = x[np.newaxis] * gains[:, np.newaxis, np.newaxis]
+        return np.clip(y, -1.0, 1.0, out=y)
+
+    def process_block(self, samples, out=None):
+        """ Apply gain, allocating a single output buffer
+
+        Args:
+            samples (np.array): Input samples
+            out (np.array): Buffer for the output, e.g. samples itself
+        Returns:
+            (np.array): Output samples
+        """
+        value = float(self.parameters_values["value"])
+        y = np.multiply(samples, 10 ** (value / 20.0), out=out)
+        return np.clip(y, -1.0, 1.0, out=y)
@@ -1,9 +1,11 @@
-import os
-import soundfile as sf
+import copy
 import logging
 import numpy as np
 import sox
+import soundfile as sf
 from .BaseDegradation import Degradation
+from .ResourceCache import RESOURCE_CACHE
+from .utils import get_power, get_tile_segments, resolve_resource_path, tile
 
 
 class DegradationMix(Degradation):
@@ -18,68 +20,175 @@ class DegradationMix(Degradation):
                         "Full or relative path (to resources dir) of noise"),
                        ("snr",
                         "6",
-                        "Desired Signal-to-Noise-Ratio [dB]")]
+                        "Desired Signal-to-Noise-Ratio [dB]"),
+                       ("offset",
+                        "0",
+                        ("Start time of noise [s], or random "
+                         "(optional, default: 0)"))]
+    streamable = True
+    needs_prepass = True
+    stack_parameters = ['snr']
+    min_block_size = 65536  # Minimum samples mixed by each thread
 
     def read_noise(self, noise_path, audio_file):
         """ Read samples of noise resampled at the sample_rate of input
 
+        Decoded noises are kept in RESOURCE_CACHE. Mono noises keep a single
+        channel, broadcast to all channels of input when mixed.
+
         Args:
             audio_file (AudioFile): Input AudioFile
         Returns:
-            (np.array): Samples of noise with shape (2, nsamples)
+            (np.array): Read-only samples of noise with shape
+                (n_channels, nsamples) or (1, nsamples)
         """
-        sample_rate = audio_file.sample_rate
-        extra_tmp_path = audio_file.tmp_path + '.extra.wav'
-        tfm = sox.Transformer()
-        tfm.rate(sample_rate)
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(noise_path, extra_tmp_path)
-
-        aux_x_noise, sr = sf.read(extra_tmp_path)
-        aux_x_noise = aux_x_noise.T
-        assert sr == sample_rate
-        os.remove(extra_tmp_path)
-        if len(aux_x_noise.shape) == 1:
-            noise_samples = np.zeros((2, len(aux_x_noise)))
-            noise_samples[0, :] = aux_x_noise
-            noise_samples[1, :] = aux_x_noise
-        else:
-            noise_samples = aux_x_noise
-        return noise_samples
-
-    def adjust_noise_duration(self, noise_samples, audio_file):
+        return RESOURCE_CACHE.get_resource(noise_path,
+                                           audio_file.sample_rate,
+                                           audio_file.samples.shape[0],
+                                           audio_file.samples.dtype)
+
+    def get_noise_offset(self, noise_num_samples, sample_rate):
+        """ Get the sample of noise mixed with the first sample of input
+
+        Offset random should be replaced by a concrete start time before
+        applying (see sample_random_values); otherwise it is drawn from the
+        global NumPy random state.
+
+        Args:
+            noise_num_samples (int): Number of samples of noise
+            sample_rate (int): Sample rate of noise [Hz]
+        Returns:
+            (int): Offset in samples, lower than noise_num_samples
+        """
+        offset = self.parameters_values.get('offset', 0)
+        if offset == 'random':
+            return np.random.randint(noise_num_samples)
+        return int(round(float(offset) * sample_rate)) % noise_num_samples
+
+    def adjust_noise_duration(self, noise_samples, audio_file, offset=0):
         """ Adjust the duration of noise_samples to fit audio_file
 
         In case it is shorter, it repeats the noise.
 
         Args:
-            noise_samples (np.array): Samples of noise with shape (2, nsamples)
+            noise_samples (np.array): Samples of noise with shape
+                (n_channels, nsamples) or (1, nsamples)
             audio_file (AudioFile): Input audio
+            offset (int): Sample of noise where the output starts
+        Returns:
+            (np.array): Samples of noise with shape
+                (n_channels or 1, new_nsamples)
+        """
+        return tile(noise_samples, audio_file.samples.shape[1], offset)
+
+    def get_segments(self, noise_samples, audio_file):
+        """ Get segments of noise mixed with each part of input
+
+        The noise is repeated from its offset, but never materialized at the
+        duration of input: each segment refers to a contiguous part of it.
+
+        Returns:
+            (list of (int, int, int)): Start in input, start in noise and
+                length of each segment (see utils.get_tile_segments)
+        """
+        offset = self.get_noise_offset(noise_samples.shape[1],
+                                       audio_file.sample_rate)
+        return list(get_tile_segments(noise_samples.shape[1],
+                                      audio_file.samples.shape[1], offset))
+
+    @staticmethod
+    def split_segments(segments, blocks):
+        """ Group segments by blocks of input, splitting the ones crossing
+        the boundaries of blocks
+
+        Args:
+            segments (list): See get_segments
+            blocks (list of (int, int)): Start and stop of each block
         Returns:
-            (np.array): Samples of noise with shape (2, new_nsamples)
+            (list of list): Segments of each block
         """
-        input_num_samples = audio_file.samples.shape[1]
-        while noise_samples.shape[1] < input_num_samples:
-            noise_samples = np.concatenate((noise_samples, noise_samples),
-                                           axis=1)
-        noise_samples = noise_samples[:, :input_num_samples]
-        return noise_samples
+        groups = []
+        for block_start, block_stop in blocks:
+            group = []
+            for start, position, length in segments:
+                first = max(start, block_start)
+                last = min(start + length, block_stop)
+                if first < last:
+                    group.append((first, position + first - start,
+                                  last - first))
+            groups.append(group)
+        return groups
+
+    def get_groups(self, segments, audio_file):
+        """ Split segments among the threads of audio_file.executor
+        """
+        blocks = audio_file.executor.get_blocks(audio_file.samples.shape[1],
+                                                self.min_block_size)
+        if len(blocks) <= 1:
+            return [segments]
+        return self.split_segments(segments, blocks)
+
+    @staticmethod
+    def get_energies(x, noise_samples, groups, executor):
+        """ Get energies of input and repeated noise, and their correlation
+
+        Mono noise is counted as broadcast to every channel of input.
+
+        Args:
+            x (np.array): Input samples
+            noise_samples (np.array): Samples of noise (not repeated)
+            groups (list): Segments (see get_segments) of each thread
+            executor (ParallelExecutor): Threads
+        Returns:
+            (float, float, float): Sums of x * x, noise * noise and x * noise
+        """
+        broadcast = noise_samples.shape[0] != x.shape[0]
+
+        def get_group_energies(segments):
+            sum_xx = 0.0
+            sum_nn = 0.0
+            sum_xn = 0.0
+            for start, position, length in segments:
+                x_segment = x[:, start:start + length]
+                n = noise_samples[:, position:position + length]
+                sum_xx += get_power(x_segment) * x_segment.size
+                if broadcast:
+                    sum_nn += get_power(n) * x_segment.size
+                    sum_xn += float(np.einsum('ij,j->', x_segment, n[0]))
+                else:
+                    sum_nn += get_power(n) * n.size
+                    sum_xn += float(np.einsum('ij,ij->', x_segment, n))
+            return sum_xx, sum_nn, sum_xn
+
+        energies = executor.map(get_group_energies, groups)
+        return tuple(sum(e) for e in zip(*energies))
+
+    def has_random_values(self):
+        return self.parameters_values.get('offset') == 'random'
+
+    def sample_random_values(self, rng):
+        """ Replace offset random by a start time drawn uniformly from the
+        whole noise
+        """
+        if not self.has_random_values():
+            return self
+        noise_path = self.get_actual_noise_path()
+        try:
+            duration = sf.info(noise_path).duration
+        except RuntimeError:
+            duration = sox.file_info.duration(noise_path)
+        degradation = copy.copy(self)
+        degradation.parameters_values = dict(
+            self.parameters_values,
+            offset='%.6f' % rng.uniform(0, duration))
+        return degradation
 
     def get_actual_noise_path(self):
         """ Resolve full path of noise
 
         The specified noise path could be a relative path
         """
-        import audio_degrader
-        resources_dir = os.path.join(audio_degrader.__path__[0],
-                                     'resources')
-        noise_path = self.parameters_values['noise']
-        noise_path_resource = os.path.join(resources_dir, noise_path)
-        if (not os.path.isfile(noise_path)
-                and os.path.isfile(noise_path_resource)):
-            return noise_path_resource
-        else:
-            return noise_path
+        return resolve_resource_path(self.parameters_values['noise'])
 
     def get_noise_gain_factor(self, snr_dbs, rms_noise, rms_input):
         """ Get gain factor that should be applied to noise
@@ -101,17 +210,119 @@ class DegradationMix(Degradation):
 
     def apply(self, audio_file):
         noise_path = self.get_actual_noise_path()
-        noise_samples = self.adjust_noise_duration(
-            self.read_noise(noise_path, audio_file),
-            audio_file)
-        rms_noise = np.sqrt(np.mean(np.power(noise_samples, 2)))
-        rms_input = np.sqrt(np.mean(np.power(audio_file.samples, 2)))
-        noise_gain_factor = self.get_noise_gain_factor(
+        noise_samples = self.read_noise(noise_path, audio_file)
+        groups = self.get_groups(
+            self.get_segments(noise_samples, audio_file), audio_file)
+        x = audio_file.samples
+        sum_xx, sum_nn, sum_xn = self.get_energies(x, noise_samples, groups,
+                                                   audio_file.executor)
+        rms_input = np.sqrt(sum_xx / x.size)
+        g = self.get_noise_gain_factor(
             float(self.parameters_values['snr']),
-            rms_noise,
+            np.sqrt(sum_nn / x.size),
             rms_input)
-        y = audio_file.samples + noise_samples * noise_gain_factor
         # Normalize output RMS to fit input RMS
-        rms_y = np.sqrt(np.mean(np.power(y, 2)))
-        y = y * rms_input / rms_y
+        rms_y = np.sqrt((sum_xx + 2 * g * sum_xn + g * g * sum_nn) / x.size)
+        output_gain_factor = rms_input / rms_y
+        # y = (x + noise * g) * output_gain_factor, segment by segment
+        y = x if audio_file.can_modify_samples() else x.copy()
+        scaled_noise = noise_samples * g
+
+        def mix_group(segments):
+            for start, position, length in segments:
+                y_segment = y[:, start:start + length]
+                y_segment += scaled_noise[:, position:position + length]
+                y_segment *= output_gain_factor
+
+        audio_file.executor.map(mix_group, groups)
         audio_file.samples = y
+
+    def apply_stacked(self, audio_file, degradations):
+        """ Mix the same noise with several SNRs
+
+        The noise is read and its power computed only once. The RMS of each
+        output is derived from the powers and the cross-correlation of input
+        and noise instead of being measured on every output.
+        """
+        noise_path = self.get_actual_noise_path()
+        x = audio_file.samples
+        noise_samples = self.read_noise(noise_path, audio_file)
+        segments = self.get_segments(noise_samples, audio_file)
+        power_input, power_noise, cross = [
+            e / x.size for e in self.get_energies(
+                x, noise_samples, self.get_groups(segments, audio_file),
+                audio_file.executor)]
+        noise_gain_factors = np.array([
+            self.get_noise_gain_factor(float(d.parameters_values['snr']),
+                                       np.sqrt(power_noise),
+                                       np.sqrt(power_input))
+            for d in degradations])
+        power_y = (power_input + 2 * noise_gain_factors * cross +
+                   noise_gain_factors ** 2 * power_noise)
+        output_gain_factors = np.sqrt(power_input / power_y)
+        y = np.empty((len(degradations),) + x.shape, dtype=x.dtype)
+        y[:] = x
+        noise_gain_factors = noise_gain_factors.astype(x.dtype)
+        for start, position, length in segments:
+            y[:, :, start:start + length] += (
+                noise_gain_factors[:, np.newaxis, np.newaxis] *
+                noise_samples[np.newaxis, :, position:position + length])
+        y *= output_gain_factors.astype(x.dtype)[:, np.newaxis, np.newaxis]
+        return y
+
+    def _next_noise_block(self, n):
+        """ Get next n samples of the noise repeated indefinitely
+        """
+        noise_length = self._noise.shape[1]
+        block = tile(self._noise, n, self._noise_position)
+        self._noise_position = (self._noise_position + n) % noise_length
+        return block
+
+    def _load_stream_noise(self, dtype):
+        if self._noise is None:
+            self._noise = RESOURCE_CACHE.get_resource(
+                self.get_actual_noise_path(), self._sample_rate,
+                self._n_channels, dtype=dtype)
+            self._noise_offset = self.get_noise_offset(self._noise.shape[1],
+                                                       self._sample_rate)
+            self._noise_position = self._noise_offset
+
+    def start_prepass(self, sample_rate, n_channels):
+        self._sample_rate = sample_rate
+        self._n_channels = n_channels
+        self._noise = None
+        self._noise_offset = 0
+        self._noise_position = 0
+        self._sum_xx = 0.0
+        self._sum_nn = 0.0
+        self._sum_xn = 0.0
+        self._count = 0
+
+    def prepass_block(self, samples):
+        self._load_stream_noise(samples.dtype)
+        noise = self._next_noise_block(samples.shape[1])
+        self._sum_xx += np.sum(samples * samples)
+        self._sum_nn += (np.sum(noise * noise) *
+                         samples.shape[0] / noise.shape[0])
+        self._sum_xn += np.sum(samples * noise)
+        self._count += samples.size
+
+    def start_stream(self, sample_rate, n_channels):
+        rms_input = np.sqrt(self._sum_xx / self._count)
+        rms_noise = np.sqrt(self._sum_nn / self._count)
+        self._noise_gain_factor = self.get_noise_gain_factor(
+            float(self.parameters_values['snr']),
+            rms_noise,
+            rms_input)
+        g = self._noise_gain_factor
+        rms_y = np.sqrt((self._sum_xx + 2 * g * self._sum_xn +
+                         g * g * self._sum_nn) / self._count)
+        self._output_gain_factor = rms_input / rms_y
+        self._noise_position = self._noise_offset
+        return sample_rate
+
+    def process_block(self, samples):
+        self._load_stream_noise(samples.dtype)
+        noise = self._next_noise_block(samples.shape[1])
+        y = samples + noise * self._noise_gain_factor
+        return y * self._output_gain_factor
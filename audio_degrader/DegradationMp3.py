@@ -1,31 +1,189 @@
-from .utils import run
-import soundfile as sf
+import inspect
+import io
 import logging
-import os
-import sox
+import numpy as np
+import soundfile as sf
+from .utils import get_raw_format_args, run_sox_pipe
+from .utils import raw_to_samples, samples_to_raw
 from .BaseDegradation import Degradation
+from .PolyphaseResampler import PolyphaseResampler
 
 
 class DegradationMp3(Degradation):
+    """ Encode and decode mp3 in memory with soundfile (libsndfile >= 1.1
+    and soundfile >= 0.13), or with sox through pipes otherwise. No
+    temporary files are written in any case.
+
+    With soundfile the MPEG version, and so the range of bitrates, is fixed
+    by the sample rate (see bitrate_ranges). Bitrates below the range, e.g.
+    8k at 44.1 kHz, are encoded at a lower sample rate and resampled back,
+    as lame does through sox.
+    """
 
     name = "mp3"
     description = "Emulate mp3 transcoding"
     parameters_info = [("bitrate", "320k", "Quality [bps]")]
+    backend = None
+    """ string: soundfile, sox, or None to use soundfile if supported
+    """
+    bitrate_ranges = [(32000, 32, 320), (16000, 8, 160), (0, 8, 64)]
+    """ list: Minimum sample rate [Hz] and range of bitrates [kbps] of
+    MPEG-1, MPEG-2 and MPEG-2.5 layer III
+    """
+    decoder_delay = 1105
+    """ int: Delay of encoding and decoding [samples] (576 + 529), which
+    libsndfile does not remove when lame resamples internally (low bitrates)
+    """
+
+    @staticmethod
+    def is_soundfile_supported():
+        """ Check if soundfile can encode mp3 with a constant bitrate
+        """
+        return ('MP3' in sf.available_formats() and
+                'bitrate_mode' in inspect.signature(sf.write).parameters)
+
+    def get_bitrate(self):
+        """ Get bitrate [kbps], e.g. 32 for "32k"
+        """
+        return float(str(self.parameters_values["bitrate"]).replace('k', ''))
+
+    @staticmethod
+    def get_bitrate_range(sample_rate):
+        """ Get bitrates that soundfile can encode at a sample rate
+
+        Args:
+            sample_rate (int): Sample rate [Hz]
+        Returns:
+            (int, int): Lowest and highest bitrate [kbps]
+        """
+        for min_sample_rate, low, high in DegradationMp3.bitrate_ranges:
+            if sample_rate >= min_sample_rate:
+                return low, high
+
+    @staticmethod
+    def get_codec_sample_rate(bitrate, sample_rate):
+        """ Get the sample rate at which soundfile can encode a bitrate
+
+        Args:
+            bitrate (float): Desired bitrate [kbps]
+            sample_rate (int): Sample rate of input [Hz]
+        Returns:
+            (int): sample_rate, or its half or quarter if bitrate is below
+                the range of its MPEG version
+        """
+        low, _ = DegradationMp3.get_bitrate_range(sample_rate)
+        while (bitrate < low and
+               DegradationMp3.get_bitrate_range(sample_rate // 2)[0] < low):
+            sample_rate //= 2
+            low, _ = DegradationMp3.get_bitrate_range(sample_rate)
+        return sample_rate
+
+    @staticmethod
+    def get_compression_level(bitrate, sample_rate):
+        """ Get compression level of libsndfile giving a constant bitrate
+
+        libsndfile maps compression levels linearly to the range of bitrates
+        of the MPEG version used at sample_rate, rounding down to a valid
+        bitrate.
+
+        Args:
+            bitrate (float): Desired bitrate [kbps]
+            sample_rate (int): Sample rate [Hz]
+        Returns:
+            (float): Compression level, from 0.0 (highest bitrate) to 1.0
+        """
+        low, high = DegradationMp3.get_bitrate_range(sample_rate)
+        # Slightly below the exact level, so rounding does not go down
+        level = (high - bitrate) / float(high - low) - 1e-6
+        return min(max(level, 0.0), 0.999)
+
+    def transcode_with_soundfile(self, samples, sample_rate, bitrate):
+        """ Encode and decode mp3 with in-memory buffers
+
+        Args:
+            samples (np.array): Samples with shape (n_channels, nsamples)
+            sample_rate (int): Sample rate [Hz]
+            bitrate (float): Bitrate [kbps]
+        Returns:
+            (np.array): Decoded samples, aligned with the input and with the
+                same shape and dtype
+        """
+        codec_sample_rate = self.get_codec_sample_rate(bitrate, sample_rate)
+        if codec_sample_rate != sample_rate:
+            logging.debug("Encoding mp3 %gk at %d Hz" %
+                          (bitrate, codec_sample_rate))
+            decoded = PolyphaseResampler.resample_signal(
+                self.transcode_with_soundfile(
+                    PolyphaseResampler.resample_signal(
+                        samples, sample_rate, codec_sample_rate),
+                    codec_sample_rate, bitrate),
+                codec_sample_rate, sample_rate)
+            return self.fit_length(decoded, samples.shape[1])
+        low, high = self.get_bitrate_range(sample_rate)
+        if not low <= bitrate <= high:
+            logging.warning("mp3 at %d Hz supports %d-%dk with soundfile: "
+                            "encoding %gk at %dk" %
+                            (sample_rate, low, high, bitrate,
+                             min(max(bitrate, low), high)))
+        mp3 = io.BytesIO()
+        sf.write(mp3, samples.T, sample_rate, format='MP3',
+                 subtype='MPEG_LAYER_III',
+                 compression_level=self.get_compression_level(bitrate,
+                                                              sample_rate),
+                 bitrate_mode='CONSTANT')
+        mp3.seek(0)
+        decoded, _ = sf.read(mp3, dtype=np.dtype(samples.dtype).name,
+                             always_2d=True)
+        decoded = decoded.T
+        n_samples = samples.shape[1]
+        if decoded.shape[1] != n_samples:
+            decoded = decoded[:, self.decoder_delay:]
+        return self.fit_length(decoded, n_samples)
+
+    @staticmethod
+    def fit_length(samples, n_samples):
+        """ Cut or pad samples with zeros to n_samples per channel
+        """
+        samples = samples[:, :n_samples]
+        if samples.shape[1] < n_samples:
+            samples = np.pad(samples,
+                             ((0, 0), (0, n_samples - samples.shape[1])))
+        return np.ascontiguousarray(samples)
+
+    def transcode_with_sox(self, samples, sample_rate, bitrate):
+        """ Encode and decode mp3 with two sox processes through pipes
+
+        Args:
+            samples (np.array): Samples with shape (n_channels, nsamples)
+            sample_rate (int): Sample rate [Hz]
+            bitrate (float): Bitrate [kbps]
+        Returns:
+            (np.array): Decoded samples
+        """
+        n_channels = samples.shape[0]
+        raw_format = get_raw_format_args(sample_rate, n_channels)
+        mp3 = run_sox_pipe(raw_format + ['-'] +
+                           ['-t', 'mp3', '-C', '%g.01' % bitrate, '-'],
+                           samples_to_raw(samples))
+        decoded = run_sox_pipe(['-t', 'mp3', '-'] + raw_format + ['-'], mp3)
+        return raw_to_samples(decoded, n_channels, samples.dtype)
 
     def apply(self, audio_file):
-        bitrate = str(self.parameters_values["bitrate"])
-        bitrate = bitrate.replace('k', '')
-        tmp_mp3_path = audio_file.tmp_path + ".mp3"
-        tmp_wav_path = audio_file.tmp_path + ".mp3.wav"
-        out, err, returncode = run("sox {0} -C {1}.01 {2}".format(
-            audio_file.tmp_path, bitrate, tmp_mp3_path))
-        logging.debug(out)
-        logging.debug(err)
-        tfm = sox.Transformer()
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(tmp_mp3_path, tmp_wav_path)
-        samples, _ = sf.read(tmp_wav_path)
-        samples = samples.T
-        audio_file.samples = samples
-        os.remove(tmp_mp3_path)
-        os.remove(tmp_wav_path)
+        bitrate = self.get_bitrate()
+        logging.debug("Transcoding to mp3 with bitrate %gk" % bitrate)
+        backend = self.backend
+        if backend is None:
+            backend = 'soundfile' if self.is_soundfile_supported() else 'sox'
+        if backend == 'soundfile':
+            try:
+                audio_file.samples = self.transcode_with_soundfile(
+                    audio_file.samples, audio_file.sample_rate, bitrate)
+                return
+            except RuntimeError:
+                if self.backend is not None:
+                    raise
+                # e.g. sample rates not supported by mp3
+                logging.warning("soundfile could not transcode to mp3, "
+                                "using sox")
+        audio_file.samples = self.transcode_with_sox(
+            audio_file.samples, audio_file.sample_rate, bitrate)
@@ -8,12 +8,39 @@ class DegradationNormalization(Degradation):
     name = "normalize"
     description = "Normalize amplitude of audio to range [-1.0, 1.0]"
     parameters_info = []
+    streamable = True
+    needs_prepass = True
 
     def apply(self, audio_file):
         x = audio_file.samples
-        x = x - np.mean(x)
-        max_amp = np.max(np.abs(x))
+        x = np.subtract(x, np.mean(x),
+                        out=x if audio_file.can_modify_samples() else None)
+        max_amp = max(np.max(x), -np.min(x))
         logging.debug("Max abs(amplitude): {0:.3f}".format(max_amp))
         x /= max_amp
-        x = np.minimum(np.maximum(-1.0, x), 1.0)
-        audio_file.samples = x
+        audio_file.samples = np.clip(x, -1.0, 1.0, out=x)
+
+    def start_prepass(self, sample_rate, n_channels):
+        self._sum = 0.0
+        self._count = 0
+        self._max = -np.inf
+        self._min = np.inf
+
+    def prepass_block(self, samples):
+        if samples.size == 0:
+            return
+        self._sum += np.sum(samples)
+        self._count += samples.size
+        self._max = max(self._max, np.max(samples))
+        self._min = min(self._min, np.min(samples))
+
+    def start_stream(self, sample_rate, n_channels):
+        self._mean = self._sum / self._count
+        self._max_amp = max(self._max - self._mean, self._mean - self._min)
+        logging.debug("Max abs(amplitude): {0:.3f}".format(self._max_amp))
+        return sample_rate
+
+    def process_block(self, samples):
+        x = samples - self._mean
+        x /= self._max_amp
+        return np.clip(x, -1.0, 1.0, out=x)
@@ -1,9 +1,8 @@
-import soundfile as sf
 import logging
 import numpy as np
 import sox
-import os
 from .BaseDegradation import Degradation
+from .utils import apply_sox_effects
 
 
 class DegradationPitchShifting(Degradation):
@@ -15,18 +14,24 @@ class DegradationPitchShifting(Degradation):
          "0.9",
          "Pitch shift factor")]
 
-    def apply(self, audio_file):
+    def get_n_semitones(self):
         pitch_shift_factor = float(
             self.parameters_values["pitch_shift_factor"])
-        n_semitones = 12 * np.log2(pitch_shift_factor)
-        logging.info('Shifting pitch with factor %f, i.e. %f semitones' %
-                     (pitch_shift_factor, n_semitones))
-        extra_tmp_path = audio_file.tmp_path + '.extra.wav'
+        return 12 * np.log2(pitch_shift_factor)
+
+    def get_sox_effects(self, sample_rate):
+        # pitch changes the rate of the signal, which is restored here so
+        # that following effects of a fused chain get the original rate
         tfm = sox.Transformer()
-        tfm.pitch(n_semitones)
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(audio_file.tmp_path, extra_tmp_path)
-        y, sr = sf.read(extra_tmp_path)
-        y = y.T
-        os.remove(extra_tmp_path)
-        audio_file.samples = y
+        tfm.pitch(self.get_n_semitones())
+        tfm.rate(sample_rate)
+        return tfm.effects, sample_rate
+
+    def apply(self, audio_file):
+        logging.info('Shifting pitch with factor %s, i.e. %f semitones' %
+                     (self.parameters_values["pitch_shift_factor"],
+                      self.get_n_semitones()))
+        effects, _ = self.get_sox_effects(audio_file.sample_rate)
+        audio_file.samples = apply_sox_effects(audio_file.samples,
+                                               audio_file.sample_rate,
+                                               effects)
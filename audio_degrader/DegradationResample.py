@@ -1,12 +1,47 @@
+import numpy as np
 from .BaseDegradation import Degradation
+from .PolyphaseResampler import PolyphaseResampler
 
 
 class DegradationResample(Degradation):
+    """ Resample in memory with a native polyphase filter, also when
+    streaming
+    """
 
     name = "resample"
     description = "Resample to given sample rate"
-    parameters_info = [("sample_rate", "8000", "Desired sample rate [Hz]")]
+    parameters_info = [("sample_rate", "8000", "Desired sample rate [Hz]"),
+                       ("quality",
+                        "high",
+                        "Quality of filter: low, medium or high (optional, "
+                        "default: high)")]
+    streamable = True
+
+    def get_quality(self):
+        return self.parameters_values.get('quality', 'high')
 
     def apply(self, audio_file):
         audio_file.resample(
-            int(self.parameters_values['sample_rate']))
+            int(self.parameters_values['sample_rate']),
+            self.get_quality())
+
+    def start_stream(self, sample_rate, n_channels):
+        new_sample_rate = int(self.parameters_values['sample_rate'])
+        g = np.gcd(new_sample_rate, sample_rate)
+        up, down = new_sample_rate // g, sample_rate // g
+        self._resampler = None
+        if up != down:
+            self._resampler = PolyphaseResampler(
+                up, down,
+                PolyphaseResampler.get_filter(up, down, self.get_quality()))
+        return new_sample_rate
+
+    def process_block(self, samples):
+        if self._resampler is None:
+            return samples
+        return self._resampler.process(samples)
+
+    def end_stream(self):
+        if self._resampler is None:
+            return None
+        return self._resampler.flush()
@@ -0,0 +1,47 @@
+import logging
+from .BaseDegradation import Degradation
+from .utils import apply_sox_effects
+
+
+class DegradationSoxChain(Degradation):
+    """ Consecutive sox-based degradations run by a single sox process
+
+    It is built by ChainPlanner and it is not available from the command
+    line. The effects of every degradation are concatenated, so samples are
+    sent to sox and read back only once.
+    """
+
+    name = "sox_chain"
+    description = "Apply several sox-based degradations at once"
+    parameters_info = []
+
+    def __init__(self, degradations):
+        """
+        Args:
+            degradations (list of Degradation): Degradations whose
+                get_sox_effects is not None
+        """
+        self.degradations = degradations
+        self.parameters_values = {
+            'degradations': [str(d) for d in degradations]}
+
+    def has_random_values(self):
+        return any(d.has_random_values() for d in self.degradations)
+
+    def get_sox_effects(self, sample_rate):
+        effects = []
+        for degradation in self.degradations:
+            degradation_effects, sample_rate = degradation.get_sox_effects(
+                sample_rate)
+            effects += degradation_effects
+        return effects, sample_rate
+
+    def apply(self, audio_file):
+        logging.info("Applying %s with a single sox process" %
+                     ', '.join(self.parameters_values['degradations']))
+        effects, sample_rate = self.get_sox_effects(audio_file.sample_rate)
+        audio_file.samples = apply_sox_effects(audio_file.samples,
+                                               audio_file.sample_rate,
+                                               effects,
+                                               sample_rate)
+        audio_file.sample_rate = sample_rate
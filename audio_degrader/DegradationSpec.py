@@ -0,0 +1,212 @@
+import glob
+import os
+import re
+import numpy as np
+from .AllDegradations import ALL_DEGRADATIONS
+from .ParametersParser import ParametersParser
+from .utils import NAME_SEP, PARAMETERS_SEP
+from .utils import get_resources_dir, split_parameters
+
+
+class Uniform(object):
+    """ Parameter drawn from a uniform distribution, e.g. U(-12,6) """
+
+    def __init__(self, low, high):
+        self.low = float(low)
+        self.high = float(high)
+
+    def sample(self, rng):
+        return repr(rng.uniform(self.low, self.high))
+
+    def __str__(self):
+        return "U({0!r},{1!r})".format(self.low, self.high)
+
+
+class Choice(object):
+    """ Parameter drawn from a list of options, e.g. choice(sounds/*.wav)
+    or choice(8000|16000)
+    """
+
+    def __init__(self, options, spec=None):
+        if len(options) == 0:
+            raise Exception("No options in %s" % spec)
+        self.options = options
+        self.spec = spec
+
+    @staticmethod
+    def expand_options(patterns):
+        """ Expand glob patterns of options
+
+        Patterns are tried as they are and relative to the resources dir.
+        Options matching no file are kept literally.
+
+        Args:
+            patterns (list of string): Options, possibly with wildcards
+        Returns:
+            (list of string): Sorted paths matching each pattern, or the
+                pattern itself
+        """
+        resources_dir = get_resources_dir()
+        options = []
+        for pattern in patterns:
+            paths = sorted(glob.glob(pattern))
+            if len(paths) == 0:
+                paths = sorted(
+                    os.path.relpath(p, resources_dir) for p in
+                    glob.glob(os.path.join(resources_dir, pattern)))
+            options += paths if paths else [pattern]
+        return options
+
+    def sample(self, rng):
+        return self.options[rng.randint(len(self.options))]
+
+    def __str__(self):
+        if self.spec is not None:
+            return self.spec
+        return "choice({0})".format('|'.join(self.options))
+
+
+class DegradationSpec(object):
+    """ Degradation whose parameters can be random
+
+    Each call to sample creates a new Degradation with parameters drawn
+    from the given random generator.
+    """
+
+    def __init__(self, name, values):
+        """
+        Args:
+            name (string): Name of degradation
+            values (list): Value of each parameter, a string or a random
+                parameter (Uniform, Choice)
+        """
+        if name not in ALL_DEGRADATIONS:
+            raise Exception("Degradation %s not known" % name)
+        self.name = name
+        self.values = values
+
+    def is_random(self):
+        return any(not isinstance(v, str) for v in self.values)
+
+    def sample(self, rng):
+        """ Create a degradation with parameters drawn from rng
+
+        Random values of the degradation itself (e.g. offset random of mix)
+        are drawn from rng too (see Degradation.sample_random_values).
+
+        Args:
+            rng (np.random.RandomState): Random generator
+        Returns:
+            (Degradation): Degradation with specified parameters
+        """
+        degradation = ALL_DEGRADATIONS[self.name]()
+        parameters_values = {}
+        for value, info in zip(self.values, degradation.parameters_info):
+            if not isinstance(value, str):
+                value = value.sample(rng)
+            parameters_values[info[0]] = value
+        degradation.parameters_values = parameters_values
+        return degradation.sample_random_values(rng)
+
+    @staticmethod
+    def parse(degradation_args):
+        """ Parse degradation arguments with optional random parameters
+
+        Besides literal values, parameters can be U(low,high) for a uniform
+        float and choice(option1|option2|...) for one of the options, which
+        can be glob patterns of files, e.g. "mix,choice(sounds/*.wav),U(0,20)"
+
+        Args:
+            degradation_args (string): Input degradation arguments
+        Returns:
+            (DegradationSpec): Specification of the degradation
+        """
+        name, _, params_str = degradation_args.partition(NAME_SEP)
+        values = []
+        if params_str:
+            for param in split_parameters(params_str):
+                uniform = re.match(r'^U\((.*),(.*)\)$', param)
+                choice = re.match(r'^choice\((.*)\)$', param)
+                if uniform:
+                    values.append(Uniform(*uniform.groups()))
+                elif choice:
+                    values.append(Choice(
+                        Choice.expand_options(choice.group(1).split('|')),
+                        param))
+                else:
+                    values.append(param)
+        return DegradationSpec(name, values)
+
+    def __str__(self):
+        if len(self.values) == 0:
+            return self.name
+        return self.name + NAME_SEP + PARAMETERS_SEP.join(
+            str(v) for v in self.values)
+
+
+class ChainSpec(object):
+    """ Sequence of degradations whose parameters can be random """
+
+    def __init__(self, degradation_specs):
+        """
+        Args:
+            degradation_specs (list of DegradationSpec): Specs of each step
+        """
+        self.degradation_specs = degradation_specs
+
+    def sample(self, rng):
+        """ Create degradations with parameters drawn from rng
+
+        Args:
+            rng (np.random.RandomState): Random generator
+        Returns:
+            (list of Degradation): Degradations with specified parameters
+        """
+        return [spec.sample(rng) for spec in self.degradation_specs]
+
+    @staticmethod
+    def parse(degradations_args):
+        """ Parse a list of degradations arguments (see
+        DegradationSpec.parse)
+
+        Args:
+            degradations_args (list of string): Input degradations arguments
+        Returns:
+            (ChainSpec): Specification of the chain
+        """
+        return ChainSpec([DegradationSpec.parse(args)
+                          for args in degradations_args])
+
+    def generate(self, audio_file, seed=None, n_variants=None):
+        """ Apply the chain with fresh parameters, lazily
+
+        The input is not modified: each variant is applied to a fork of
+        audio_file (see AudioFile.fork). Forks keep samples in memory
+        (in_memory=True) whatever the mode of audio_file, since only their
+        samples are yielded, so pure-NumPy degradations do not touch the
+        disk.
+
+        Args:
+            audio_file (AudioFile): Input audio
+            seed (int): Seed of the random generator
+            n_variants (int): Number of variants (default: infinite)
+        Yields:
+            (np.array, list of string): Samples of each variant and the
+                arguments of its degradations, e.g. ["gain,-3.52"]
+        """
+        rng = np.random.RandomState(seed)
+        n = 0
+        while n_variants is None or n < n_variants:
+            degradations = self.sample(rng)
+            variant = audio_file.fork()
+            variant.in_memory = True
+            for degradation in degradations:
+                variant.apply_degradation(degradation)
+            variant.delete_tmp_files()
+            yield variant.samples, [
+                ParametersParser.get_degradation_args(d)
+                for d in degradations]
+            n += 1
+
+    def __str__(self):
+        return ' '.join(str(s) for s in self.degradation_specs)
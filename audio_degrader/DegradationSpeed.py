@@ -1,8 +1,7 @@
-import soundfile as sf
 import logging
 from .BaseDegradation import Degradation
+from .utils import apply_sox_effects
 import sox
-import os
 
 
 class DegradationSpeed(Degradation):
@@ -14,15 +13,18 @@ class DegradationSpeed(Degradation):
          "0.9",
          "Playback speed factor")]
 
+    def get_sox_effects(self, sample_rate):
+        # speed changes the rate of the signal, which is restored here so
+        # that following effects of a fused chain get the original rate
+        tfm = sox.Transformer()
+        tfm.speed(float(self.parameters_values['speed']))
+        tfm.rate(sample_rate)
+        return tfm.effects, sample_rate
+
     def apply(self, audio_file):
         speed_factor = float(self.parameters_values['speed'])
         logging.info('Modifying speed with factor %f' % speed_factor)
-        extra_tmp_path = audio_file.tmp_path + '.extra.wav'
-        tfm = sox.Transformer()
-        tfm.speed(speed_factor)
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(audio_file.tmp_path, extra_tmp_path)
-        y, sr = sf.read(extra_tmp_path)
-        y = y.T
-        os.remove(extra_tmp_path)
-        audio_file.samples = y
+        effects, _ = self.get_sox_effects(audio_file.sample_rate)
+        audio_file.samples = apply_sox_effects(audio_file.samples,
+                                               audio_file.sample_rate,
+                                               effects)
@@ -1,8 +1,7 @@
-import soundfile as sf
 import logging
 import sox
-import os
 from .BaseDegradation import Degradation
+from .utils import apply_sox_effects
 
 
 class DegradationTimeStretching(Degradation):
@@ -14,17 +13,17 @@ class DegradationTimeStretching(Degradation):
          "0.9",
          "Time stretch factor")]
 
+    def get_sox_effects(self, sample_rate):
+        tfm = sox.Transformer()
+        tfm.tempo(float(self.parameters_values["time_stretch_factor"]))
+        return tfm.effects, sample_rate
+
     def apply(self, audio_file):
         time_stretch_factor = float(
             self.parameters_values["time_stretch_factor"])
         logging.info(('Time stretching with factor %f' %
                       (time_stretch_factor)))
-        extra_tmp_path = audio_file.tmp_path + '.extra.wav'
-        tfm = sox.Transformer()
-        tfm.tempo(time_stretch_factor)
-        tfm.convert(n_channels=2, bitdepth=32)
-        tfm.build(audio_file.tmp_path, extra_tmp_path)
-        y, sr = sf.read(extra_tmp_path)
-        y = y.T
-        os.remove(extra_tmp_path)
-        audio_file.samples = y
+        effects, _ = self.get_sox_effects(audio_file.sample_rate)
+        audio_file.samples = apply_sox_effects(audio_file.samples,
+                                               audio_file.sample_rate,
+                                               effects)
@@ -6,9 +6,19 @@ class DegradationTrim(Degradation):
     name = "trim_from"
     description = "Trim audio from a given start time"
     parameters_info = [("start_time", 0.1, "Trim start [seconds]")]
+    streamable = True
 
     def apply(self, audio_file):
         start_time = float(self.parameters_values["start_time"])
         start_sample = int(start_time * audio_file.sample_rate)
-        audio_file.samples = audio_file.samples[
-            :, start_sample:]
+        audio_file.trim(start_sample)
+
+    def start_stream(self, sample_rate, n_channels):
+        start_time = float(self.parameters_values["start_time"])
+        self._samples_to_skip = int(start_time * sample_rate)
+        return sample_rate
+
+    def process_block(self, samples):
+        skip = min(self._samples_to_skip, samples.shape[1])
+        self._samples_to_skip -= skip
+        return samples[:, skip:]
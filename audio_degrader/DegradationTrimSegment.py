@@ -0,0 +1,33 @@
+from .BaseDegradation import Degradation
+
+
+class DegradationTrimSegment(Degradation):
+
+    name = "trim_segment"
+    description = "Keep only the segment between two given times"
+    parameters_info = [("start_time", 0.1, "Segment start [seconds]"),
+                       ("end_time", 10.0, "Segment end [seconds]")]
+    streamable = True
+
+    def _get_segment(self, sample_rate):
+        start_time = float(self.parameters_values["start_time"])
+        end_time = float(self.parameters_values["end_time"])
+        if end_time < start_time:
+            raise Exception("end_time must not be before start_time")
+        return int(start_time * sample_rate), int(end_time * sample_rate)
+
+    def apply(self, audio_file):
+        audio_file.trim(*self._get_segment(audio_file.sample_rate))
+
+    def start_stream(self, sample_rate, n_channels):
+        self._samples_to_skip, self._samples_left = self._get_segment(
+            sample_rate)
+        self._samples_left -= self._samples_to_skip
+        return sample_rate
+
+    def process_block(self, samples):
+        skip = min(self._samples_to_skip, samples.shape[1])
+        self._samples_to_skip -= skip
+        samples = samples[:, skip:skip + self._samples_left]
+        self._samples_left -= samples.shape[1]
+        return samples
@@ -0,0 +1,86 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ParallelExecutor(object):
+    """ Run parts of a degradation in a pool of threads
+
+    FFTs, filters and dot products of NumPy and scipy release the GIL, so
+    channels and time blocks processed in different threads use several
+    cores. Threads are opt-in: the number of threads is given to AudioFile
+    or set with the environment variable AUDIO_DEGRADER_NUM_THREADS, and it
+    is 1 (no threads) by default. Pools are shared by all executors with the
+    same number of threads.
+
+    Functions run by map must not call map themselves.
+    """
+    env_var = 'AUDIO_DEGRADER_NUM_THREADS'
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, num_threads=None):
+        """
+        Args:
+            num_threads (int): Number of threads, 0 for one per core
+                (default: environment variable AUDIO_DEGRADER_NUM_THREADS,
+                or 1)
+        """
+        self.num_threads = self.get_num_threads(num_threads)
+
+    @staticmethod
+    def get_num_threads(num_threads=None):
+        """ Resolve the number of threads
+
+        Args:
+            num_threads (int): Number of threads, 0 for one per core, or
+                None to read the environment variable
+        Returns:
+            (int): Number of threads, at least 1
+        """
+        if num_threads is None:
+            num_threads = int(os.environ.get(ParallelExecutor.env_var, 1))
+        if num_threads == 0:
+            num_threads = os.cpu_count() or 1
+        return max(1, int(num_threads))
+
+    def _get_pool(self):
+        with self._pools_lock:
+            if self.num_threads not in self._pools:
+                self._pools[self.num_threads] = ThreadPoolExecutor(
+                    self.num_threads,
+                    thread_name_prefix='audio_degrader')
+            return self._pools[self.num_threads]
+
+    def map(self, function, items):
+        """ Apply function to every item, in parallel if there are threads
+
+        Args:
+            function (function): Function with one argument
+            items (iterable): Arguments
+        Returns:
+            (list): Results, in the order of items
+        """
+        items = list(items)
+        if self.num_threads == 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        return list(self._get_pool().map(function, items))
+
+    def get_blocks(self, n_samples, min_block_size=1, n_parts=1):
+        """ Split samples in contiguous blocks, one per thread and part
+
+        Args:
+            n_samples (int): Number of samples to split
+            min_block_size (int): Minimum samples per block
+            n_parts (int): Number of parts already processed in parallel
+                (e.g. channels), so fewer blocks are needed
+        Returns:
+            (list of (int, int)): Start and stop of each block
+        """
+        if n_samples == 0:
+            return []
+        n_blocks = -(-self.num_threads // n_parts)
+        n_blocks = max(1, min(n_blocks, n_samples // max(1, min_block_size)))
+        block_size = -(-n_samples // n_blocks)
+        return [(start, min(start + block_size, n_samples))
+                for start in range(0, n_samples, block_size)]
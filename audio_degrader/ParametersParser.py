@@ -59,6 +59,24 @@ class ParametersParser(object):
         degradation = ALL_DEGRADATIONS[name]()
         return degradation
 
+    @staticmethod
+    def get_degradation_args(degradation):
+        """ Get the arguments defining a degradation (inverse of
+        parse_degradation_args)
+
+        Args:
+            degradation (Degradation): Degradation with parameters set
+        Returns:
+            (string): Degradation arguments, e.g. "gain,6"
+        """
+        parameters_values = getattr(degradation, 'parameters_values', {})
+        values = [str(parameters_values[name])
+                  for name, _, _ in degradation.parameters_info
+                  if name in parameters_values]
+        if len(values) == 0:
+            return degradation.name
+        return degradation.name + NAME_SEP + PARAMETERS_SEP.join(values)
+
     @staticmethod
     def parse_degradations_args(degradations_args):
         """ Parse a list of degradations arguments
@@ -0,0 +1,159 @@
+import numpy as np
+from scipy import fft
+
+
+class PartitionedConvolver(object):
+    """ Uniform-partitioned overlap-save convolution
+
+    The impulse response is split into partitions of block_size samples
+    whose spectra are computed once (see get_spectra). Input is processed in
+    blocks of block_size samples for all channels at once, keeping a
+    frequency-domain delay line with the spectra of the last blocks, so
+    memory is bounded by block_size and the impulse response length, and
+    not by the input length. Only the first len(x) samples of the full
+    convolution are computed.
+    """
+
+    def __init__(self, spectra, block_size):
+        """
+        Args:
+            spectra (np.array): Partitioned impulse response spectra with
+                shape (n_partitions, n_channels or 1, block_size + 1)
+            block_size (int): Samples per block
+        """
+        self.spectra = spectra
+        self.block_size = block_size
+        self._fdl = None
+        self._previous = None
+        self._pending = None
+
+    @staticmethod
+    def get_spectra(ir, block_size):
+        """ Compute spectra of the partitions of an impulse response
+
+        Args:
+            ir (np.array): Impulse response with shape (n_channels, nsamples)
+            block_size (int): Samples per partition
+        Returns:
+            (np.array): Spectra with shape
+                (n_partitions, n_channels, block_size + 1)
+        """
+        n_channels, ir_length = ir.shape
+        n_partitions = max(1, -(-ir_length // block_size))
+        partitions = np.zeros((n_partitions, n_channels, block_size),
+                              dtype=ir.dtype)
+        for p in range(n_partitions):
+            partition = ir[:, p * block_size:(p + 1) * block_size]
+            partitions[p, :, :partition.shape[1]] = partition
+        return fft.rfft(partitions, n=2 * block_size, axis=2)
+
+    def _init_state(self, n_channels, dtype):
+        n_partitions = self.spectra.shape[0]
+        self.spectra = np.broadcast_to(
+            self.spectra, (n_partitions, n_channels, self.spectra.shape[2]))
+        self._fdl = np.zeros(self.spectra.shape, dtype=self.spectra.dtype)
+        self._previous = np.zeros((n_channels, self.block_size), dtype=dtype)
+        self._pending = np.zeros((n_channels, 0), dtype=dtype)
+
+    def _process_block(self, block):
+        """ Convolve a block of exactly block_size samples
+        """
+        frame = np.concatenate((self._previous, block), axis=1)
+        self._previous = block
+        self._fdl[1:] = self._fdl[:-1]
+        self._fdl[0] = fft.rfft(frame, axis=1)
+        y_spectrum = np.einsum('pcf,pcf->cf', self._fdl, self.spectra)
+        return fft.irfft(y_spectrum, n=2 * self.block_size,
+                         axis=1)[:, self.block_size:]
+
+    def convolve(self, x, executor=None):
+        """ Convolve a complete signal
+
+        Args:
+            x (np.array): Input with shape (n_channels, nsamples)
+            executor (ParallelExecutor): Threads to convolve channels and
+                time segments in parallel (default: no threads)
+        Returns:
+            (np.array): First nsamples of the convolution
+        """
+        if executor is not None and executor.num_threads > 1:
+            return self._convolve_parallel(x, executor)
+        self._init_state(x.shape[0], x.dtype)
+        y = np.empty(x.shape, dtype=x.dtype)
+        n_samples = x.shape[1]
+        for start in range(0, n_samples, self.block_size):
+            block = x[:, start:start + self.block_size]
+            n = block.shape[1]
+            if n < self.block_size:
+                block = np.pad(block, ((0, 0), (0, self.block_size - n)))
+            y[:, start:start + n] = self._process_block(block)[:, :n]
+        return y
+
+    def _convolve_parallel(self, x, executor):
+        """ Convolve every channel and time segment with its own convolver
+
+        Each segment is convolved with the tail of the impulse response
+        (overlap-add): segments write their own samples of the output and
+        the tails are added to the following samples afterwards.
+        """
+        n_channels, n_samples = x.shape
+        tail_length = self.spectra.shape[0] * self.block_size
+        y = np.empty(x.shape, dtype=x.dtype)
+        tasks = [(channel, start, stop)
+                 for channel in range(n_channels)
+                 for start, stop in executor.get_blocks(
+                     n_samples, 4 * tail_length, n_channels)]
+
+        def convolve_segment(task):
+            channel, start, stop = task
+            segment_stop = min(stop + tail_length, n_samples)
+            segment = np.zeros((1, segment_stop - start), dtype=x.dtype)
+            segment[:, :stop - start] = x[channel, start:stop]
+            spectra = self.spectra[:, min(channel,
+                                          self.spectra.shape[1] - 1)]
+            convolver = PartitionedConvolver(spectra[:, np.newaxis],
+                                             self.block_size)
+            y_segment = convolver.convolve(segment)[0]
+            y[channel, start:stop] = y_segment[:stop - start]
+            return y_segment[stop - start:]
+
+        tails = executor.map(convolve_segment, tasks)
+        for (channel, start, stop), tail in zip(tasks, tails):
+            y[channel, stop:stop + len(tail)] += tail
+        return y
+
+    def process(self, x):
+        """ Convolve next samples of a stream
+
+        Samples are buffered until a complete block is available, so the
+        output can be shorter than the input. Call flush at the end of the
+        stream to get the remaining samples.
+
+        Args:
+            x (np.array): Next input samples with shape (n_channels, n)
+        Returns:
+            (np.array): Next output samples
+        """
+        if self._pending is None:
+            self._init_state(x.shape[0], x.dtype)
+        pending = np.concatenate((self._pending, x), axis=1)
+        n_blocks = pending.shape[1] // self.block_size
+        y = [self._process_block(pending[:, b * self.block_size:
+                                         (b + 1) * self.block_size])
+             for b in range(n_blocks)]
+        self._pending = pending[:, n_blocks * self.block_size:]
+        if len(y) == 0:
+            return np.zeros((x.shape[0], 0), dtype=x.dtype)
+        return np.concatenate(y, axis=1)
+
+    def flush(self):
+        """ Get remaining output samples of a stream
+
+        Returns:
+            (np.array): Output for samples buffered by process
+        """
+        n = self._pending.shape[1]
+        block = np.pad(self._pending, ((0, 0), (0, self.block_size - n)))
+        y = self._process_block(block)[:, :n]
+        self._pending = None
+        return y
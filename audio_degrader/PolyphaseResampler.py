@@ -0,0 +1,180 @@
+import functools
+import numpy as np
+from scipy import signal
+
+
+class PolyphaseResampler(object):
+    """ Stateful polyphase resampler for streams
+
+    Output samples are the ones of scipy.signal.resample_poly(x, up, down,
+    window=h) computed on the whole signal, but input can be given in
+    blocks of any size. Only the last taps of input are kept between blocks.
+    """
+    chunk_size = 4096  # Output samples computed at once
+    qualities = {'low': (4, 5.0, 1.0),
+                 'medium': (10, 5.0, 1.0),
+                 'high': (32, 8.0, 0.95)}
+    """ dict: Filter of each quality: half length (in periods of the highest
+    rate), beta of Kaiser window and cutoff (relative to the lowest Nyquist
+    frequency). medium is the default filter of resample_poly
+    """
+
+    def __init__(self, up, down, h):
+        """
+        Args:
+            up (int): Upsampling factor
+            down (int): Downsampling factor
+            h (np.array): Low-pass FIR filter with odd length, designed at
+                the upsampled rate (see design_filter)
+        """
+        g = np.gcd(up, down)
+        self.up = up // g
+        self.down = down // g
+        self.half_len = (len(h) - 1) // 2
+        self.n_taps = -(-len(h) // self.up)
+        h_padded = np.zeros(self.n_taps * self.up)
+        h_padded[:len(h)] = h * self.up
+        # polyphase[p, i] = h[p + i * up]
+        self.polyphase = h_padded.reshape(self.n_taps, self.up).T
+        self._buffer = None
+
+    @staticmethod
+    def design_filter(up, down, quality='medium'):
+        """ Design an anti-aliasing filter (by default the one of
+        resample_poly)
+
+        Args:
+            up (int): Upsampling factor
+            down (int): Downsampling factor
+            quality (string): low, medium or high (see qualities)
+        Returns:
+            (np.array): FIR filter coefficients
+        """
+        if quality not in PolyphaseResampler.qualities:
+            raise Exception("Resampling quality %s not known" % quality)
+        half_len_periods, beta, cutoff = PolyphaseResampler.qualities[quality]
+        g = np.gcd(up, down)
+        max_rate = max(up // g, down // g)
+        half_len = half_len_periods * max_rate
+        return signal.firwin(2 * half_len + 1, cutoff / max_rate,
+                             window=('kaiser', beta))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def get_filter(up, down, quality='high'):
+        """ Get an anti-aliasing filter, designed only once per process for
+        each ratio and quality
+
+        Args:
+            up (int): Upsampling factor
+            down (int): Downsampling factor
+            quality (string): low, medium or high (see qualities)
+        Returns:
+            (np.array): Read-only FIR filter coefficients
+        """
+        g = np.gcd(up, down)
+        h = PolyphaseResampler.design_filter(up // g, down // g, quality)
+        h.flags.writeable = False
+        return h
+
+    @staticmethod
+    def resample_signal(x, sample_rate, new_sample_rate, quality='high',
+                        executor=None):
+        """ Resample a complete signal in memory with resample_poly
+
+        Args:
+            x (np.array): Input with shape (n_channels, nsamples)
+            sample_rate (int): Sample rate of input [Hz]
+            new_sample_rate (int): Desired sample rate [Hz]
+            quality (string): low, medium or high (see qualities)
+            executor (ParallelExecutor): Threads to resample channels in
+                parallel (default: no threads)
+        Returns:
+            (np.array): Resampled signal with the dtype of x
+        """
+        g = np.gcd(int(sample_rate), int(new_sample_rate))
+        up, down = int(new_sample_rate) // g, int(sample_rate) // g
+        if up == down:
+            return x
+        h = PolyphaseResampler.get_filter(up, down, quality)
+        if executor is not None and executor.num_threads > 1:
+            channels = executor.map(
+                lambda channel: signal.resample_poly(channel, up, down,
+                                                     window=h),
+                x)
+            return np.array(channels, dtype=x.dtype)
+        y = signal.resample_poly(x, up, down, axis=1, window=h)
+        return y.astype(x.dtype, copy=False)
+
+    def _init_state(self, n_channels, dtype):
+        # Input samples before the start of the stream are zeros
+        self._buffer = np.zeros((n_channels, self.n_taps - 1), dtype=dtype)
+        self._buffer_start = -(self.n_taps - 1)
+        self._n_in = 0
+        self._n_out = 0
+
+    def _compute(self, n_stop):
+        """ Compute outputs from self._n_out up to n_stop (excluded)
+        """
+        y = []
+        for start in range(self._n_out, n_stop, self.chunk_size):
+            n = np.arange(start, min(start + self.chunk_size, n_stop))
+            t = n * self.down + self.half_len
+            newest = t // self.up - self._buffer_start
+            frames = self._buffer[:, newest[:, np.newaxis] -
+                                  np.arange(self.n_taps)]
+            y.append(np.einsum('cnk,nk->cn', frames,
+                               self.polyphase[t % self.up]))
+        self._n_out = max(self._n_out, n_stop)
+        oldest = ((self._n_out * self.down + self.half_len) // self.up -
+                  self.n_taps + 1)
+        drop = min(max(0, oldest - self._buffer_start),
+                   self._buffer.shape[1])
+        self._buffer = self._buffer[:, drop:]
+        self._buffer_start += drop
+        if len(y) == 0:
+            return self._buffer[:, :0].copy()
+        return np.concatenate(y, axis=1).astype(self._buffer.dtype,
+                                                copy=False)
+
+    def process(self, x):
+        """ Resample next samples of a stream
+
+        Args:
+            x (np.array): Next input samples with shape (n_channels, n)
+        Returns:
+            (np.array): Next output samples
+        """
+        if self._buffer is None:
+            self._init_state(x.shape[0], x.dtype)
+        self._buffer = np.concatenate((self._buffer, x), axis=1)
+        self._n_in += x.shape[1]
+        n_stop = (self._n_in * self.up - 1 - self.half_len) // self.down + 1
+        return self._compute(n_stop)
+
+    def flush(self):
+        """ Get remaining output samples of a stream
+
+        Returns:
+            (np.array): Output samples depending on the end of the stream
+        """
+        n_total = -(-self._n_in * self.up // self.down)
+        last_needed = ((n_total - 1) * self.down + self.half_len) // self.up
+        n_zeros = last_needed + 1 - (self._buffer_start +
+                                     self._buffer.shape[1])
+        if n_zeros > 0:
+            self._buffer = np.pad(self._buffer, ((0, 0), (0, n_zeros)))
+        y = self._compute(n_total)
+        self._buffer = None
+        return y
+
+    def resample(self, x):
+        """ Resample a complete signal
+
+        Args:
+            x (np.array): Input with shape (n_channels, nsamples)
+        Returns:
+            (np.array): Resampled signal
+        """
+        self._buffer = None
+        return np.concatenate((self.process(x), self.flush()), axis=1)
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+_active_stages = threading.local()
+
+
+class StageProfile(object):
+    """ Measurements of one stage (a degradation, loading or exporting)
+
+    peak_buffer_bytes is the largest samples buffer seen at the start or at
+    the end of the stage, not the peak of temporary arrays inside it.
+    """
+
+    def __init__(self, name, parameters=None):
+        self.name = name
+        self.parameters = parameters
+        self.wall_time = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.subprocess_count = 0
+        self.subprocess_time = 0.0
+        self.mirror_update_count = 0
+        self.mirror_update_time = 0.0
+        self.peak_buffer_bytes = 0
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class ChainProfile(object):
+    """ Measurements of all stages applied to an AudioFile
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, parameters=None):
+        """ Measure a stage. Records of this thread go to it meanwhile
+
+        Args:
+            name (string): Name of stage
+            parameters (dict): Parameters of the stage, if any
+        Yields:
+            (StageProfile): Profile of the stage
+        """
+        stage_profile = StageProfile(name, parameters)
+        self.stages.append(stage_profile)
+        previous = getattr(_active_stages, 'stage', None)
+        _active_stages.stage = stage_profile
+        start = time.time()
+        try:
+            yield stage_profile
+        finally:
+            stage_profile.wall_time += time.time() - start
+            _active_stages.stage = previous
+
+    def get_totals(self):
+        """ Sum all stages
+
+        Returns:
+            (dict): Total of each measurement
+        """
+        totals = StageProfile('total').to_dict()
+        del totals['parameters']
+        for stage_profile in self.stages:
+            for key, value in stage_profile.to_dict().items():
+                if key == 'peak_buffer_bytes':
+                    totals[key] = max(totals[key], value)
+                elif key not in ('name', 'parameters'):
+                    totals[key] += value
+        return totals
+
+    def to_dict(self):
+        return {'stages': [s.to_dict() for s in self.stages],
+                'total': self.get_totals()}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+def get_active_stage():
+    """ Get stage being measured in this thread (None if there is none)
+    """
+    return getattr(_active_stages, 'stage', None)
+
+
+def record_read(n_bytes):
+    stage_profile = get_active_stage()
+    if stage_profile is not None:
+        stage_profile.bytes_read += n_bytes
+
+
+def record_write(n_bytes):
+    stage_profile = get_active_stage()
+    if stage_profile is not None:
+        stage_profile.bytes_written += n_bytes
+
+
+def record_subprocess(seconds):
+    stage_profile = get_active_stage()
+    if stage_profile is not None:
+        stage_profile.subprocess_count += 1
+        stage_profile.subprocess_time += seconds
+
+
+def record_mirror_update(seconds):
+    stage_profile = get_active_stage()
+    if stage_profile is not None:
+        stage_profile.mirror_update_count += 1
+        stage_profile.mirror_update_time += seconds
+
+
+def record_buffer(samples):
+    stage_profile = get_active_stage()
+    if stage_profile is not None:
+        stage_profile.peak_buffer_bytes = max(stage_profile.peak_buffer_bytes,
+                                              samples.nbytes)
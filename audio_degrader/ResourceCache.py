@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import soundfile as sf
+from .PolyphaseResampler import PolyphaseResampler
+from .utils import read_with_sox
+
+
+class ResourceCache(object):
+    """ LRU cache of decoded resources (noises, impulse responses)
+
+    Resources are stored ready to use, i.e. resampled and converted to the
+    requested number of channels and dtype, as read-only arrays with shape
+    (n_channels, nsamples). Mono resources keep a single channel, which is
+    broadcast to the channels of the input by degradations. Entries are
+    keyed by (resolved path, mtime, sample_rate, n_channels, dtype), so a
+    modified file is decoded again. The total size of the cached arrays is
+    kept below max_bytes by evicting the least recently used entries.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int): Maximum total size of cached arrays [bytes]
+        """
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(path, sample_rate, n_channels, dtype='float64'):
+        """ Get cache key of a resource
+
+        Args:
+            path (string): Path or URL of the resource
+            sample_rate (int): Sample rate of the resource once loaded
+            n_channels (int): Number of channels once loaded
+            dtype (string): Data type of samples once loaded
+        Returns:
+            (tuple): (resolved path, mtime, sample_rate, n_channels, dtype)
+        """
+        dtype = str(np.dtype(dtype))
+        if os.path.isfile(path):
+            return (os.path.realpath(path), os.path.getmtime(path),
+                    sample_rate, n_channels, dtype)
+        return (path, None, sample_rate, n_channels, dtype)
+
+    def get_resource(self, path, sample_rate, n_channels, dtype='float64'):
+        """ Get samples of a resource, decoding it only on a cache miss
+
+        Args:
+            path (string): Path or URL of the resource
+            sample_rate (int): Desired sample rate
+            n_channels (int): Desired number of channels
+            dtype (string): Desired data type of samples
+        Returns:
+            (np.array): Read-only samples with shape (n_channels, nsamples)
+                or (1, nsamples)
+        """
+        key = self.get_key(path, sample_rate, n_channels, dtype)
+        return self.get(key, lambda: self.load_resource(
+            path, sample_rate, n_channels, dtype))
+
+    def get(self, key, load):
+        """ Get cached array, calling load() to create it on a cache miss
+
+        Args:
+            key (tuple): Cache key
+            load (function): Function without arguments returning np.array
+        Returns:
+            (np.array): Read-only cached array
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        array = load()
+        array.flags.writeable = False
+        with self._lock:
+            if key not in self._entries and array.nbytes <= self.max_bytes:
+                self._entries[key] = array
+                self.n_bytes += array.nbytes
+                self._evict()
+        return array
+
+    @staticmethod
+    def load_resource(path, sample_rate, n_channels, dtype='float64'):
+        """ Decode a resource and resample it in memory
+
+        Formats not supported by soundfile (e.g. mp3) and URLs are decoded
+        and resampled with sox through a pipe instead. Resources that are
+        mono, or whose channels do not match n_channels, are returned as
+        mono to be broadcast.
+
+        Args:
+            path (string): Path or URL of the resource
+            sample_rate (int): Desired sample rate
+            n_channels (int): Desired number of channels
+            dtype (string): Desired data type of samples
+        Returns:
+            (np.array): Samples with shape (n_channels, nsamples) or
+                (1, nsamples)
+        """
+        logging.debug("Loading resource %s" % path)
+        try:
+            samples, resource_sample_rate = sf.read(
+                path, dtype=np.dtype(dtype).name, always_2d=True)
+        except RuntimeError:
+            return read_with_sox(path, sample_rate, n_channels, dtype)
+        samples = samples.T
+        if samples.shape[0] != n_channels and samples.shape[0] > 1:
+            # Mix down to mono (as sox), broadcast later to every channel
+            samples = samples.mean(axis=0, keepdims=True)
+        return np.ascontiguousarray(PolyphaseResampler.resample_signal(
+            samples, resource_sample_rate, sample_rate))
+
+    def _evict(self):
+        while self.n_bytes > self.max_bytes:
+            _, array = self._entries.popitem(last=False)
+            self.n_bytes -= array.nbytes
+
+    def clear(self):
+        """ Remove all entries and reset counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+RESOURCE_CACHE = ResourceCache()
+""" ResourceCache: Cache shared by all degradations of the process """
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import os
+import uuid
+import numpy as np
+from . import Profiler
+from . import __version__
+from .DegradationSoxChain import DegradationSoxChain
+from .ParametersParser import ParametersParser
+
+
+class ResultCache(object):
+    """ On-disk cache of the samples after every prefix of a chain
+
+    Entries are keyed by (hash of the input contents, degradations applied
+    so far, dtype, keep_channels, library version), so a chain resumes from
+    the samples of its longest cached prefix: changing only the last step
+    of a chain recomputes only that step. Each entry is a .npz file with
+    samples and sample_rate in cache_dir, which can be shared by processes.
+    The total size of entries is kept below max_bytes by deleting the least
+    recently used ones (using their modification times).
+
+    Degradations are identified by their arguments (see
+    ParametersParser.get_degradation_args), so noises and impulse responses
+    are identified by path: entries are not invalidated if those files
+    change. Steps with random values (e.g. mix offset random, see
+    Degradation.sample_random_values) and the following ones are never
+    cached.
+    """
+
+    def __init__(self, cache_dir, max_bytes=4 * 1024 * 1024 * 1024):
+        """
+        Args:
+            cache_dir (string): Directory of cached entries
+            max_bytes (int): Maximum total size of entries [bytes]
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_input_hash(audio_file):
+        """ Hash the input of an AudioFile: contents of its input file, or
+        its samples if it was created with from_array
+
+        Args:
+            audio_file (AudioFile): Input audio, before any degradation
+        Returns:
+            (string): Hex digest
+        """
+        digest = hashlib.sha256()
+        if audio_file.audio_path is not None:
+            with open(audio_file.audio_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        else:
+            samples = np.ascontiguousarray(audio_file.samples)
+            digest.update(str((samples.shape, audio_file.sample_rate))
+                          .encode())
+            digest.update(samples.data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_step_args(degradation):
+        """ Get canonical arguments of a degradation, or None if it is
+        random
+
+        Args:
+            degradation (Degradation): Degradation with parameters set
+        Returns:
+            (string): Arguments, e.g. "gain,6"
+        """
+        if isinstance(degradation, DegradationSoxChain):
+            steps_args = [ResultCache.get_step_args(d)
+                          for d in degradation.degradations]
+            return None if None in steps_args else ' '.join(steps_args)
+        if degradation.has_random_values():
+            return None
+        return ParametersParser.get_degradation_args(degradation)
+
+    def get_keys(self, audio_file, degradations):
+        """ Get the key of every cacheable prefix of a chain
+
+        Args:
+            audio_file (AudioFile): Input audio, before any degradation
+            degradations (list of Degradation): Chain to be applied
+        Returns:
+            (list of string): Key after each step, while steps are not
+                random
+        """
+        parts = [self.get_input_hash(audio_file), str(audio_file.dtype),
+                 str(audio_file.keep_channels), __version__]
+        keys = []
+        for degradation in degradations:
+            step_args = self.get_step_args(degradation)
+            if step_args is None:
+                break
+            parts.append(step_args)
+            keys.append(hashlib.sha256('\n'.join(parts).encode())
+                        .hexdigest())
+        return keys
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def load(self, key):
+        """ Load an entry, marking it as recently used
+
+        Returns:
+            (np.array, int): Samples and sample rate, or None if missing
+        """
+        path = self._get_path(key)
+        try:
+            with np.load(path) as entry:
+                samples = entry['samples']
+                sample_rate = int(entry['sample_rate'])
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            # Missing, evicted meanwhile, or partially written
+            return None
+        Profiler.record_read(samples.nbytes)
+        return samples, sample_rate
+
+    def store(self, key, samples, sample_rate):
+        """ Store an entry, evicting the least recently used ones if needed
+
+        Args:
+            key (string): Key (see get_keys)
+            samples (np.array): Samples with shape (n_channels, nsamples)
+            sample_rate (int): Sample rate [Hz]
+        """
+        if samples.nbytes > self.max_bytes:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._get_path(key)
+        tmp_path = path + '.' + str(uuid.uuid4()) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, samples=samples, sample_rate=sample_rate)
+        os.replace(tmp_path, path)
+        Profiler.record_write(os.path.getsize(path))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, fname))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+        n_bytes = sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if n_bytes <= self.max_bytes:
+                break
+            logging.debug("Evicting cached result %s" % fname)
+            try:
+                os.remove(os.path.join(self.cache_dir, fname))
+            except OSError:
+                pass
+            n_bytes -= size
+
+    def apply_degradations(self, audio_file, degradations):
+        """ Apply a chain, resuming from its longest cached prefix and
+        caching the samples after each computed step
+
+        Args:
+            audio_file (AudioFile): Input audio, before any degradation
+            degradations (list of Degradation): Chain to be applied
+        """
+        keys = self.get_keys(audio_file, degradations)
+        n_applied = 0
+        with audio_file.profile.stage('cache_load'):
+            for i in range(len(keys), 0, -1):
+                entry = self.load(keys[i - 1])
+                if entry is not None:
+                    logging.debug("Resuming after %d cached steps" % i)
+                    audio_file.set_samples(*entry)
+                    audio_file.applied_degradations += degradations[:i]
+                    n_applied = i
+                    break
+        if n_applied > 0:
+            self.hits += 1
+        else:
+            self.misses += 1
+        for i in range(n_applied, len(degradations)):
+            audio_file.apply_degradation(degradations[i])
+            if i < len(keys):
+                with audio_file.profile.stage('cache_store'):
+                    self.store(keys[i], audio_file.samples,
+                               audio_file.sample_rate)
@@ -0,0 +1,166 @@
+import logging
+from collections import OrderedDict
+from .AudioFile import AudioFile
+from .ParametersParser import ParametersParser
+
+
+class _ChainNode(object):
+    """ Node of a tree of chains: children are keyed by degradation args
+    """
+
+    def __init__(self, degradation=None):
+        self.degradation = degradation
+        self.children = OrderedDict()
+        self.chain_indices = []  # Chains ending at this node
+
+
+class VariantDegrader(object):
+    """ Apply many chains of degradations to the same input
+
+    The input is decoded once. Chains are arranged in a tree so that a
+    prefix shared by several chains is applied only once, and every branch
+    works on a fork of the AudioFile (see AudioFile.fork). Sibling
+    degradations of the same kind differing only in numeric parameters
+    (see Degradation.stack_parameters), e.g. gains or SNRs of the same
+    noise, are computed at once as a stacked (N, n_channels, nsamples)
+    array.
+    """
+
+    def __init__(self, audio_path, tmp_dir='./', dtype='float64'):
+        """
+        Args:
+            audio_path (string): Path of input audio (any format)
+            tmp_dir (string): Directory for temporary files
+            dtype (string): Data type of samples
+        """
+        self.audio_file = AudioFile(audio_path, tmp_dir, in_memory=True,
+                                    dtype=dtype)
+
+    @staticmethod
+    def build_tree(chains):
+        """ Arrange chains in a tree of shared prefixes
+
+        Args:
+            chains (list of list): Chains of degradations arguments (e.g.
+                "gain,6") or Degradation objects
+        Returns:
+            (_ChainNode): Root of the tree
+        """
+        root = _ChainNode()
+        for i, chain in enumerate(chains):
+            node = root
+            for degradation in chain:
+                if isinstance(degradation, str):
+                    degradation = ParametersParser.parse_degradation_args(
+                        degradation)
+                key = ParametersParser.get_degradation_args(degradation)
+                if key not in node.children:
+                    node.children[key] = _ChainNode(degradation)
+                node = node.children[key]
+            node.chain_indices.append(i)
+        return root
+
+    @staticmethod
+    def get_stacks(node):
+        """ Group children that can be applied at once
+
+        Returns:
+            (list of list of _ChainNode): Groups of children. Groups with
+                more than one child can be stacked
+        """
+        groups = OrderedDict()
+        for key, child in node.children.items():
+            degradation = child.degradation
+            if degradation.stack_parameters:
+                group_key = (degradation.name,) + tuple(
+                    (name, value) for name, value in
+                    sorted(degradation.parameters_values.items())
+                    if name not in degradation.stack_parameters)
+            else:
+                group_key = key
+            groups.setdefault(group_key, []).append(child)
+        return list(groups.values())
+
+    def _visit(self, node, audio_file, reuse):
+        """ Yield results of all chains below node (depth first)
+
+        Args:
+            node (_ChainNode): Node already applied to audio_file
+            audio_file (AudioFile): Result of the chain up to node
+            reuse (bool): True if audio_file can be modified by the last
+                child, as nobody else needs it
+        """
+        for i in node.chain_indices:
+            yield i, audio_file.fork()
+        groups = self.get_stacks(node)
+        for n, group in enumerate(groups):
+            last = reuse and n == len(groups) - 1
+            if len(group) > 1:
+                degradations = [child.degradation for child in group]
+                logging.debug("Applying {0} stacked {1} degradations".format(
+                    len(group), group[0].degradation))
+                base = audio_file.fork()
+                with base.profile.stage(
+                        group[0].degradation.name,
+                        {'stacked': [ParametersParser.get_degradation_args(d)
+                                     for d in degradations]}):
+                    stack = degradations[0].apply_stacked(base, degradations)
+                for child, samples in zip(group, stack):
+                    for result in self._visit(
+                            child, base.fork(samples, child.degradation),
+                            True):
+                        yield result
+            else:
+                child = group[0]
+                child_file = audio_file if last else audio_file.fork()
+                child_file.apply_degradation(child.degradation)
+                for result in self._visit(child, child_file, True):
+                    yield result
+                if not last:
+                    child_file.delete_tmp_files()
+
+    def iter_variants(self, chains):
+        """ Apply all chains, yielding each result as soon as it is ready
+
+        Results are yielded in depth-first order of the tree of chains, not
+        in the order of chains.
+
+        Args:
+            chains (list of list): Chains of degradations arguments (e.g.
+                "gain,6") or Degradation objects
+        Yields:
+            (int, AudioFile): Index of chain and its result. Its samples
+                are read-only and may be shared with other results
+        """
+        root = self.build_tree(chains)
+        for result in self._visit(root, self.audio_file, False):
+            yield result
+
+    def apply_chains(self, chains):
+        """ Apply all chains and get samples of their results
+
+        Args:
+            chains (list of list): Chains of degradations arguments (e.g.
+                "gain,6") or Degradation objects
+        Returns:
+            (list of (np.array, int)): Samples and sample rate of each chain
+        """
+        results = [None] * len(chains)
+        for i, audio_file in self.iter_variants(chains):
+            results[i] = (audio_file.samples, audio_file.sample_rate)
+        return results
+
+    def to_wavs(self, chains, output_paths):
+        """ Apply all chains and write their results
+
+        Args:
+            chains (list of list): Chains of degradations arguments (e.g.
+                "gain,6") or Degradation objects
+            output_paths (list of string): Output wav path of each chain
+        """
+        for i, audio_file in self.iter_variants(chains):
+            audio_file.to_wav(output_paths[i])
+            audio_file.delete_tmp_files()
+
+    def delete_tmp_files(self):
+        self.audio_file.delete_tmp_files()
@@ -1,4 +1,7 @@
+__version__ = '1.3.1'
+
 from .AudioFile import AudioFile
+from .AudioStream import AudioStream
 from .BaseDegradation import Degradation, DegradationUsageDocGenerator
 from .DegradationConvolution import DegradationConvolution
 from .DegradationDynamicRangeCompression import \
@@ -12,15 +15,30 @@ from .DegradationResample import DegradationResample
 from .DegradationSpeed import DegradationSpeed
 from .DegradationTimeStretching import DegradationTimeStretching
 from .DegradationTrim import DegradationTrim
+from .DegradationTrimSegment import DegradationTrimSegment
 from .DegradationEqualization import DegradationEqualization
 from .ParametersParser import ParametersParser
 from .AllDegradations import ALL_DEGRADATIONS
+from .ResourceCache import ResourceCache, RESOURCE_CACHE
+from .PartitionedConvolver import PartitionedConvolver
+from .PolyphaseResampler import PolyphaseResampler
+from .BatchDegrader import BatchDegrader, BatchJob, BatchResult
+from .Profiler import ChainProfile, StageProfile
+from .DegradationSoxChain import DegradationSoxChain
+from .ChainPlanner import ChainPlanner
+from .VariantDegrader import VariantDegrader
+from .DegradationSpec import DegradationSpec, ChainSpec
+from .ParallelExecutor import ParallelExecutor
+from .AsyncDegrader import AsyncDegrader
+from .ResultCache import ResultCache
 
 
 __all__ = ["AudioFile",
+           "AudioStream",
            "Degradation",
            "DegradationUsageDocGenerator",
            "DegradationTrim",
+           "DegradationTrimSegment",
            "DegradationMp3",
            "DegradationGain",
            "DegradationNormalization",
@@ -33,4 +51,21 @@ __all__ = ["AudioFile",
            "DegradationResample",
            "DegradationEqualization",
            "ALL_DEGRADATIONS",
-           "ParametersParser"]
+           "ParametersParser",
+           "ResourceCache",
+           "RESOURCE_CACHE",
+           "PartitionedConvolver",
+           "PolyphaseResampler",
+           "BatchDegrader",
+           "BatchJob",
+           "BatchResult",
+           "ChainProfile",
+           "StageProfile",
+           "DegradationSoxChain",
+           "ChainPlanner",
+           "VariantDegrader",
+           "DegradationSpec",
+           "ParallelExecutor",
+           "AsyncDegrader",
+           "ResultCache",
+           "ChainSpec"]
@@ -1,5 +1,10 @@
+import os
+import struct
 import subprocess
 import logging
+import time
+import numpy as np
+from . import Profiler
 
 
 NAME_SEP = ","
@@ -9,10 +14,263 @@ DESCRIPTION_SEP = ": "
 
 def run(cmd):
     logging.debug(cmd)
+    start = time.time()
     p = subprocess.Popen(cmd, shell=True,
                          stdout=subprocess.PIPE,
                          stderr=subprocess.PIPE)
     out, err = p.communicate()
+    Profiler.record_subprocess(time.time() - start)
     if p.returncode != 0:
         logging.error("Error running: " + cmd)
     return out, err, p.returncode
+
+
+def build_sox(tfm, input_path, output_path):
+    """ Run a sox Transformer from a file into another one
+
+    Time of the sox process and sizes of both files are recorded into the
+    active profiling stage (see Profiler).
+
+    Args:
+        tfm (sox.Transformer): Transformer to run
+        input_path (string): Path of input file
+        output_path (string): Path of output file
+    """
+    start = time.time()
+    tfm.build(input_path, output_path)
+    Profiler.record_subprocess(time.time() - start)
+    Profiler.record_read(os.path.getsize(input_path))
+    Profiler.record_write(os.path.getsize(output_path))
+
+
+def get_raw_format_args(sample_rate, n_channels):
+    """ Get sox format arguments of raw little-endian 32 bits float audio
+
+    Args:
+        sample_rate (int): Sample rate [Hz]
+        n_channels (int): Number of channels
+    Returns:
+        (list of string): Arguments preceding '-' (stdin or stdout)
+    """
+    return ['-t', 'raw', '-e', 'floating-point', '-b', '32', '-L',
+            '-r', str(int(sample_rate)), '-c', str(n_channels)]
+
+
+def run_sox_pipe(args, input_bytes=None):
+    """ Run sox writing input_bytes to its stdin and reading its stdout
+
+    Time of the sox process is recorded into the active profiling stage.
+
+    Args:
+        args (list of string): Arguments of sox
+        input_bytes (bytes): Data for stdin (None if sox reads a file)
+    Returns:
+        (bytes): Data written by sox to stdout
+    """
+    cmd = ['sox'] + [str(arg) for arg in args]
+    logging.debug(' '.join(cmd))
+    start = time.time()
+    p = subprocess.Popen(cmd,
+                         stdin=(subprocess.DEVNULL if input_bytes is None
+                                else subprocess.PIPE),
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    out, err = p.communicate(input_bytes)
+    Profiler.record_subprocess(time.time() - start)
+    if p.returncode != 0:
+        raise Exception("Error running %s: %s" %
+                        (' '.join(cmd), err.decode(errors='replace')))
+    return out
+
+
+def samples_to_raw(samples):
+    """ Convert samples with shape (n_channels, nsamples) into raw audio
+    """
+    return np.ascontiguousarray(samples.T, dtype='<f4').tobytes()
+
+
+def raw_to_samples(raw, n_channels, dtype='float64'):
+    """ Convert raw audio into samples with shape (n_channels, nsamples)
+    """
+    samples = np.frombuffer(raw, dtype='<f4').reshape(-1, n_channels)
+    return samples.T.astype(dtype)
+
+
+def apply_sox_effects(samples, sample_rate, effects, output_sample_rate=None):
+    """ Apply sox effects to samples through pipes, without temporary files
+
+    Args:
+        samples (np.array): Samples with shape (n_channels, nsamples)
+        sample_rate (int): Sample rate of samples [Hz]
+        effects (list of string): sox effects, e.g. sox.Transformer.effects
+        output_sample_rate (int): Sample rate after the effects (default:
+            sample_rate). sox adds a rate effect if needed to get it
+    Returns:
+        (np.array): Processed samples with the same dtype and channels
+    """
+    if output_sample_rate is None:
+        output_sample_rate = sample_rate
+    n_channels = samples.shape[0]
+    out = run_sox_pipe(get_raw_format_args(sample_rate, n_channels) +
+                       ['-'] +
+                       get_raw_format_args(output_sample_rate, n_channels) +
+                       ['-'] + list(effects),
+                       samples_to_raw(samples))
+    return raw_to_samples(out, n_channels, samples.dtype)
+
+
+def read_with_sox(path, sample_rate, n_channels, dtype='float64'):
+    """ Decode any audio supported by sox into samples
+
+    Args:
+        path (string): Path or URL of the audio
+        sample_rate (int): Desired sample rate [Hz]
+        n_channels (int): Desired number of channels
+        dtype (string): Desired data type of samples
+    Returns:
+        (np.array): Samples with shape (n_channels, nsamples)
+    """
+    out = run_sox_pipe([path] +
+                       get_raw_format_args(sample_rate, n_channels) +
+                       ['-', 'rate', '-h', sample_rate])
+    return raw_to_samples(out, n_channels, dtype)
+
+
+def write_float_wav_header(f, sample_rate, n_channels, n_frames, dtype,
+                           data_offset=64):
+    """ Write the header of a wav file of interleaved float samples
+
+    The space between the fmt chunk and the data chunk is declared as a JUNK
+    chunk, so samples can start anywhere after byte 52, e.g. aligned for
+    memory mapping, or further after trimming the beginning in place.
+
+    Args:
+        f (file): File opened in binary mode for writing
+        sample_rate (int): Sample rate [Hz]
+        n_channels (int): Number of channels
+        n_frames (int): Number of samples per channel
+        dtype (string): float32 or float64
+        data_offset (int): Position of the first sample [bytes], even and
+            at least 52
+    """
+    bytes_per_sample = np.dtype(dtype).itemsize
+    block_align = n_channels * bytes_per_sample
+    data_size = n_frames * block_align
+    f.seek(0)
+    f.write(struct.pack('<4sI4s4sIHHIIHH4sI',
+                        b'RIFF', data_offset - 8 + data_size, b'WAVE',
+                        b'fmt ', 16, 3, n_channels, int(sample_rate),
+                        int(sample_rate) * block_align, block_align,
+                        8 * bytes_per_sample,
+                        b'JUNK', data_offset - 52))
+    f.seek(data_offset - 8)
+    f.write(struct.pack('<4sI', b'data', data_size))
+
+
+def get_power(x):
+    """ Get mean of squared samples in a single pass, without temporaries
+
+    Args:
+        x (np.array): Samples
+    Returns:
+        (float): Mean power
+    """
+    if x.size == 0:
+        return 0.0
+    if x.flags.c_contiguous or x.flags.f_contiguous:
+        flat = x.ravel(order='K')  # A view, in memory order
+        return float(np.dot(flat, flat)) / x.size
+    return float(np.einsum('ij,ij->', x, x)) / x.size
+
+
+def get_tile_segments(period, n_samples, offset=0):
+    """ Split a signal repeated every period samples in contiguous segments
+
+    Sample i of the repeated signal is sample (offset + i) % period of the
+    original one.
+
+    Args:
+        period (int): Number of samples of the original signal
+        n_samples (int): Number of samples of the repeated signal
+        offset (int): Sample of the original signal where repetition starts
+    Yields:
+        (int, int, int): Start in the repeated signal, start in the
+            original signal and length of each segment
+    """
+    position = offset % period
+    start = 0
+    while start < n_samples:
+        length = min(period - position, n_samples - start)
+        yield start, position, length
+        start += length
+        position = 0
+
+
+def tile(samples, n_samples, offset=0):
+    """ Repeat samples along the last axis up to n_samples
+
+    Only the output buffer is allocated, unlike repeated concatenation.
+
+    Args:
+        samples (np.array): Samples with shape (n_channels, nsamples)
+        n_samples (int): Number of samples of the output
+        offset (int): Sample of input where the output starts
+    Returns:
+        (np.array): Samples with shape (n_channels, n_samples)
+    """
+    out = np.empty((samples.shape[0], n_samples), dtype=samples.dtype)
+    segments = get_tile_segments(samples.shape[1], n_samples, offset)
+    for start, position, length in segments:
+        out[:, start:start + length] = samples[:, position:position + length]
+    return out
+
+
+def get_resources_dir():
+    """ Get directory of resources installed with the package
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'resources')
+
+
+def split_parameters(params_str):
+    """ Split parameters, ignoring separators inside parentheses
+
+    e.g. "choice(a|b),U(0,20)" gives ["choice(a|b)", "U(0,20)"]
+
+    Args:
+        params_str (string): Parameters separated by PARAMETERS_SEP
+    Returns:
+        (list of string): Parameters
+    """
+    params = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(params_str):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == PARAMETERS_SEP and depth == 0:
+            params.append(params_str[start:i])
+            start = i + 1
+    params.append(params_str[start:])
+    return params
+
+
+def resolve_resource_path(path):
+    """ Resolve full path of a resource (e.g. noise or impulse response)
+
+    The specified path could be relative to the resources directory. It is
+    checked on every call, as files can be created or the working directory
+    changed; decoded resources are cached by ResourceCache instead.
+
+    Args:
+        path (string): Full path, URL or path relative to resources dir
+    Returns:
+        (string): Path of the resource
+    """
+    path_resource = os.path.join(get_resources_dir(), path)
+    if not os.path.isfile(path) and os.path.isfile(path_resource):
+        return path_resource
+    else:
+        return path
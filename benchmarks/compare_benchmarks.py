@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+""" Compare two results files of run_benchmarks.py
+
+    $ python benchmarks/compare_benchmarks.py before.json after.json
+
+Exit code is 1 if any case got slower (or used more memory) than the given
+threshold.
+"""
+import argparse
+import json
+
+
+def get_key(result):
+    return (result['name'], result['duration'], result['n_channels'],
+            result['sample_rate'])
+
+
+def compare(old_report, new_report, threshold=0.1):
+    """ Compare real-time factor, loading time and peak RSS of cases
+    present in both
+
+    Args:
+        old_report (dict): Baseline results
+        new_report (dict): New results
+        threshold (float): Relative increase considered a regression
+    Returns:
+        (list of dict): Comparison of each case, with field regression
+    """
+    old_results = {get_key(r): r for r in old_report['results']
+                   if 'error' not in r}
+    comparisons = []
+    for new in new_report['results']:
+        old = old_results.get(get_key(new))
+        if old is None or 'error' in new:
+            continue
+        rtf_ratio = max(new['rtf'], 1e-12) / max(old['rtf'], 1e-12)
+        load_ratio = (max(new['load_time'], 1e-12) /
+                      max(old['load_time'], 1e-12))
+        rss_ratio = (float(new['peak_rss_bytes']) /
+                     max(old['peak_rss_bytes'], 1))
+        comparisons.append({
+            'key': get_key(new),
+            'old_rtf': old['rtf'],
+            'new_rtf': new['rtf'],
+            'rtf_ratio': rtf_ratio,
+            'load_ratio': load_ratio,
+            'rss_ratio': rss_ratio,
+            'regression': (rtf_ratio > 1 + threshold or
+                           load_ratio > 1 + threshold or
+                           rss_ratio > 1 + threshold)})
+    return comparisons
+
+
+def main(args):
+    with open(args['old']) as f:
+        old_report = json.load(f)
+    with open(args['new']) as f:
+        new_report = json.load(f)
+    print("old: {0} ({1})".format(old_report['metadata']['commit'],
+                                  old_report['metadata']['date']))
+    print("new: {0} ({1})".format(new_report['metadata']['commit'],
+                                  new_report['metadata']['date']))
+    comparisons = compare(old_report, new_report, args['threshold'])
+    print("{0:<18} {1:>8} {2:>3} {3:>6}  {4:>10} {5:>10} {6:>7} {7:>7} "
+          "{8:>7}".format('case', 'duration', 'ch', 'sr', 'old_rtf',
+                          'new_rtf', 'speed', 'load', 'rss'))
+    for c in comparisons:
+        name, duration, n_channels, sample_rate = c['key']
+        print("{0:<18} {1:>8} {2:>3} {3:>6}  {4:>10.5f} {5:>10.5f} "
+              "{6:>6.2f}x {7:>6.2f}x {8:>6.2f}x{9}".format(
+                  name, duration, n_channels, sample_rate,
+                  c['old_rtf'], c['new_rtf'], 1.0 / c['rtf_ratio'],
+                  1.0 / c['load_ratio'], c['rss_ratio'],
+                  '  REGRESSION' if c['regression'] else ''))
+    regressions = [c for c in comparisons if c['regression']]
+    print("{0} cases compared, {1} regressions".format(len(comparisons),
+                                                       len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare two results files of run_benchmarks.py")
+    parser.add_argument('old', type=str, help='Baseline results (JSON)')
+    parser.add_argument('new', type=str, help='New results (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help=('Relative increase of real-time factor, '
+                              'loading time or peak RSS reported as '
+                              'regression. '
+                              'Default: %(default)s'))
+    exit(main(vars(parser.parse_args())))
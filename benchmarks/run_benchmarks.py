@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+""" Time every degradation and some chains on synthetic inputs
+
+Each case runs in a fresh python process, so its peak RSS is not polluted
+by previous cases. Only resources bundled with the package are used.
+Results are saved as JSON and can be compared with compare_benchmarks.py.
+
+    $ python benchmarks/run_benchmarks.py --durations 1 60 -o before.json
+
+e.g. mp3 transcoding in memory against sox:
+
+    $ python benchmarks/run_benchmarks.py --cases mp3 --mp3-backend sox
+
+or decoding inputs natively against sox (load_time is the time to the first
+degradation; the load case has no degradations, only per-file overhead):
+
+    $ python benchmarks/run_benchmarks.py --cases load --decoder sox
+"""
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import soundfile as sf
+
+# Measure the package of this checkout, not an installed one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEGRADATION_CASES = {
+    'trim_from': ['trim_from,0.5'],
+    'trim_segment': ['trim_segment,0.5,10'],
+    'mp3': ['mp3,64k'],
+    'gain': ['gain,6'],
+    'normalize': ['normalize'],
+    'mix': ['mix,sounds/ambience-pub.wav,6'],
+    'resample': ['resample,22050'],
+    'convolution': ['convolution,impulse_responses/ir_classroom_mono.wav,0.7'],
+    'speed': ['speed,1.1'],
+    'pitch_shift': ['pitch_shift,0.9'],
+    'time_stretch': ['time_stretch,1.1'],
+    'equalize': ['equalize,1000,500,-6'],
+    'dr_compression': ['dr_compression,2'],
+}
+""" dict: Degradations of the benchmark of each entry of ALL_DEGRADATIONS
+"""
+
+CHAIN_CASES = {
+    'chain_broadcast': ['gain,-3',
+                        'equalize,1000,500,-6',
+                        'dr_compression,2',
+                        'normalize'],
+    'chain_noisy_room': ['mix,sounds/ambience-pub.wav,6',
+                         'convolution,impulse_responses/ir_classroom_mono.wav,'
+                         '0.7',
+                         'normalize'],
+    'chain_phone': ['resample,8000',
+                    'equalize,2000,1500,-10',
+                    'mp3,32k',
+                    'mix,sounds/white-noise.wav,20'],
+    'chain_tempo': ['speed,1.1',
+                    'pitch_shift,0.9',
+                    'time_stretch,1.1'],
+}
+""" dict: Representative chains of several degradations
+"""
+
+OVERHEAD_CASES = {
+    'load': [],
+}
+""" dict: Cases measuring only loading and exporting each file
+"""
+
+DEFAULT_DURATIONS = [1, 60, 3600]
+DEFAULT_CHANNELS = [1, 2]
+DEFAULT_SAMPLE_RATES = [8000, 16000, 44100, 48000]
+
+
+def get_cases():
+    """ Get all benchmark cases, checking every degradation has one
+
+    Returns:
+        (dict): Degradations arguments of each case name
+    """
+    from audio_degrader import ALL_DEGRADATIONS
+    missing = set(ALL_DEGRADATIONS) - set(DEGRADATION_CASES)
+    if missing:
+        raise Exception("No benchmark for degradations: %s" %
+                        ', '.join(sorted(missing)))
+    cases = dict(DEGRADATION_CASES)
+    cases.update(CHAIN_CASES)
+    cases.update(OVERHEAD_CASES)
+    return cases
+
+
+def write_synthetic_input(path, duration, n_channels, sample_rate,
+                          block_duration=10):
+    """ Write a 16 bits wav with tones and noise, block by block
+
+    Args:
+        path (string): Output path
+        duration (float): Duration [s]
+        n_channels (int): Number of channels
+        sample_rate (int): Sample rate [Hz]
+        block_duration (float): Duration of each written block [s]
+    """
+    rng = np.random.RandomState(0)
+    freqs = np.array([110.0, 440.0, 1000.0, 3000.0])
+    freqs = freqs[freqs < sample_rate / 2.0]
+    n_samples = int(duration * sample_rate)
+    block_size = int(block_duration * sample_rate)
+    with sf.SoundFile(path, 'w', samplerate=sample_rate,
+                      channels=n_channels, subtype='PCM_16') as f:
+        for start in range(0, n_samples, block_size):
+            t = np.arange(start, min(start + block_size, n_samples))
+            t = t / float(sample_rate)
+            tones = np.sin(2 * np.pi * np.outer(t, freqs)).mean(axis=1)
+            envelope = 0.5 + 0.4 * np.sin(2 * np.pi * 0.5 * t)
+            x = 0.5 * envelope[:, np.newaxis] * tones[:, np.newaxis]
+            x = x + 0.02 * rng.randn(len(t), n_channels)
+            f.write(x)
+
+
+def run_case(case):
+    """ Apply degradations of a case to its input (in this process)
+
+    Args:
+        case (dict): Fields name, degradations, input_path, tmp_dir,
+            duration, in_memory, dtype, in_place, trace_memory,
+            mp3_backend, decoder and num_threads
+    Returns:
+        (dict): Measurements
+    """
+    from audio_degrader import AudioFile, ParametersParser, DegradationMp3
+    DegradationMp3.backend = case.get('mp3_backend')
+    AudioFile.decoder = case.get('decoder')
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    degradations = ParametersParser.parse_degradations_args(
+        case['degradations'])
+    output_path = os.path.join(case['tmp_dir'], case['name'] + '_out.wav')
+    start = time.time()
+    audio_file = AudioFile(case['input_path'], case['tmp_dir'],
+                           in_memory=case['in_memory'], dtype=case['dtype'],
+                           in_place=case.get('in_place', False),
+                           num_threads=case.get('num_threads', 1))
+    load_time = time.time() - start
+    if case.get('trace_memory'):
+        tracemalloc.start()
+    start = time.time()
+    for degradation in degradations:
+        audio_file.apply_degradation(degradation)
+    process_time = time.time() - start
+    process_peak_alloc = None
+    if case.get('trace_memory'):
+        process_peak_alloc = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    start = time.time()
+    audio_file.to_wav(output_path)
+    export_time = time.time() - start
+    audio_file.delete_tmp_files()
+    os.remove(output_path)
+    total = audio_file.profile.get_totals()
+    return {'load_time': load_time,
+            'process_time': process_time,
+            'export_time': export_time,
+            'rtf': process_time / case['duration'],
+            'peak_rss_bytes': (resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024),
+            'baseline_rss_bytes': baseline_rss,
+            'process_peak_alloc_bytes': process_peak_alloc,
+            'buffer_bytes': audio_file.samples.nbytes,
+            'subprocess_count': total['subprocess_count'],
+            'subprocess_time': total['subprocess_time'],
+            'bytes_read': total['bytes_read'],
+            'bytes_written': total['bytes_written'],
+            'stages': audio_file.profile.to_dict()['stages']}
+
+
+def run_case_in_subprocess(case, timeout=None):
+    """ Run a case in a fresh python process
+
+    Args:
+        case (dict): See run_case
+        timeout (float): Maximum time [s] (default: no limit)
+    Returns:
+        (dict): Measurements, or error if the case failed
+    """
+    cmd = [sys.executable, os.path.abspath(__file__),
+           '--run-case', json.dumps(case)]
+    try:
+        p = subprocess.run(cmd, stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'error': 'Timeout after {0} s'.format(timeout)}
+    if p.returncode != 0:
+        return {'error': p.stderr.decode(errors='replace').strip()}
+    return json.loads(p.stdout.decode().strip().split('\n')[-1])
+
+
+def get_metadata():
+    """ Get information about the machine and the code being measured
+    """
+    import audio_degrader
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (subprocess.CalledProcessError, OSError):
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(),
+            'commit': commit,
+            'audio_degrader_path': os.path.dirname(audio_degrader.__file__),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count()}
+
+
+def main(args):
+    """ Run all selected cases and save results
+
+    Args:
+        args (dict): Parsed command-line arguments
+    Returns:
+        (dict): Metadata and results
+    """
+    cases = get_cases()
+    names = args['cases'] or sorted(cases)
+    unknown = set(names) - set(cases)
+    if unknown:
+        raise Exception("Unknown cases: %s" % ', '.join(sorted(unknown)))
+    tmp_dir = tempfile.mkdtemp(prefix='audio_degrader_bench_',
+                               dir=args['tmpdir'])
+    results = []
+    try:
+        for duration, n_channels, sample_rate in itertools.product(
+                args['durations'], args['channels'], args['sample_rates']):
+            input_path = os.path.join(
+                tmp_dir, 'input_{0}s_{1}ch_{2}hz.wav'.format(
+                    duration, n_channels, sample_rate))
+            write_synthetic_input(input_path, duration, n_channels,
+                                  sample_rate)
+            for name in names:
+                case = {'name': name,
+                        'degradations': cases[name],
+                        'input_path': input_path,
+                        'tmp_dir': tmp_dir,
+                        'duration': duration,
+                        'n_channels': n_channels,
+                        'sample_rate': sample_rate,
+                        'in_memory': args['in_memory'],
+                        'dtype': args['dtype'],
+                        'in_place': args['in_place'],
+                        'trace_memory': args['trace_memory'],
+                        'mp3_backend': args['mp3_backend'],
+                        'decoder': args['decoder'],
+                        'num_threads': args['threads']}
+                runs = [run_case_in_subprocess(case, args['timeout'])
+                        for _ in range(args['repeat'])]
+                ok_runs = [r for r in runs if 'error' not in r]
+                if ok_runs:
+                    measurements = min(
+                        ok_runs, key=lambda r: r['rtf'] + r['load_time'])
+                else:
+                    measurements = runs[0]
+                result = {k: case[k] for k in ('name', 'degradations',
+                                               'duration', 'n_channels',
+                                               'sample_rate')}
+                result.update(measurements)
+                results.append(result)
+                if 'error' in result:
+                    logging.error("{0} {1}s {2}ch {3}Hz failed: {4}".format(
+                        name, duration, n_channels, sample_rate,
+                        result['error']))
+                else:
+                    print("{0:<18} {1:>6}s {2}ch {3:>5}Hz  rtf={4:.5f}  "
+                          "load={5:.4f}s  peak_rss={6:.1f}MB".format(
+                              name, duration, n_channels, sample_rate,
+                              result['rtf'], result['load_time'],
+                              result['peak_rss_bytes'] / 2.0 ** 20))
+                    if result['process_peak_alloc_bytes'] is not None:
+                        print("{0:<18} peak allocated while processing: "
+                              "{1:.2f}x buffer".format(
+                                  '', float(result['process_peak_alloc_bytes'])
+                                  / result['buffer_bytes']))
+            os.remove(input_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    metadata = get_metadata()
+    metadata.update({'in_memory': args['in_memory'],
+                     'dtype': args['dtype'],
+                     'in_place': args['in_place'],
+                     'trace_memory': args['trace_memory'],
+                     'mp3_backend': args['mp3_backend'],
+                     'decoder': args['decoder'],
+                     'num_threads': args['threads'],
+                     'repeat': args['repeat']})
+    report = {'metadata': metadata, 'results': results}
+    output_path = args['output']
+    if output_path is None:
+        output_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'results',
+            '{0}_{1}.json'.format(metadata['commit'] or 'nocommit',
+                                  datetime.datetime.now().strftime(
+                                      '%Y%m%d_%H%M%S')))
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results saved in {0}".format(output_path))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=("Measure real-time factor (processing seconds per "
+                     "second of audio) and peak RSS of every degradation "
+                     "and some chains"))
+    parser.add_argument('--durations', type=float, nargs='+',
+                        default=DEFAULT_DURATIONS,
+                        help='Durations of inputs [s]. Default: %(default)s')
+    parser.add_argument('--channels', type=int, nargs='+',
+                        default=DEFAULT_CHANNELS,
+                        help='Channels of inputs. Default: %(default)s')
+    parser.add_argument('--sample-rates', dest='sample_rates', type=int,
+                        nargs='+', default=DEFAULT_SAMPLE_RATES,
+                        help='Sample rates of inputs. Default: %(default)s')
+    parser.add_argument('--cases', type=str, nargs='+', default=None,
+                        help='Names of cases to run. Default: all')
+    parser.add_argument('--in-memory', dest='in_memory',
+                        action='store_true',
+                        help='Use AudioFile(in_memory=True)')
+    parser.add_argument('--in-place', dest='in_place', action='store_true',
+                        help='Use AudioFile(in_place=True)')
+    parser.add_argument('--trace-memory', dest='trace_memory',
+                        action='store_true',
+                        help=('Measure peak memory allocated while '
+                              'processing with tracemalloc (slower)'))
+    parser.add_argument('--mp3-backend', dest='mp3_backend', type=str,
+                        choices=['soundfile', 'sox'], default=None,
+                        help=('Backend of mp3 transcoding. Default: '
+                              'soundfile if supported'))
+    parser.add_argument('--decoder', type=str,
+                        choices=['soundfile', 'sox'], default=None,
+                        help=('Decoder of inputs. Default: soundfile if it '
+                              'reads them'))
+    parser.add_argument('-j', '--threads', type=int, default=1,
+                        help=('Threads of heavy degradations (0: one per '
+                              'core). Default: %(default)s'))
+    parser.add_argument('--dtype', type=str, default='float64',
+                        help='Data type of samples. Default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help=('Runs of each case, keeping the fastest. '
+                              'Default: %(default)s'))
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Maximum time of each run [s]. Default: none')
+    parser.add_argument('-t', '--tmpdir', type=str, default=None,
+                        help='Directory for inputs and temporary files')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help=('Output JSON file. Default: '
+                              'benchmarks/results/<commit>_<date>.json'))
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='List all cases and exit')
+    parser.add_argument('--run-case', dest='run_case', type=str,
+                        default=None, help=argparse.SUPPRESS)
+    args = vars(parser.parse_args())
+    if args['run_case']:
+        print(json.dumps(run_case(json.loads(args['run_case']))))
+        exit(0)
+    if args['list']:
+        for name, degradations in sorted(get_cases().items()):
+            print("{0:<18} {1}".format(name, ' '.join(degradations)))
+        exit(0)
+    logging.basicConfig(level=logging.WARNING)
+    main(args)
@@ -1,3 +1,4 @@
+import re
 from setuptools import setup
 from os import path
 
@@ -5,13 +6,16 @@ this_directory = path.abspath(path.dirname(__file__))
 with open(path.join(this_directory, 'README.md')) as f:
     long_description = f.read()
 
+with open(path.join(this_directory, 'audio_degrader', '__init__.py')) as f:
+    version = re.search(r"^__version__ = '(.*)'", f.read(), re.M).group(1)
+
 with open('requirements.txt') as fp:
     install_requires = fp.read()
 
 setup(
     name='audio_degrader',
     packages=['audio_degrader'],
-    version='1.3.1',
+    version=version,
     description='Tool to introduce controlled degradations to audio',
     author='Emilio Molina',
     author_email='emilio.mol.mar@gmail.com',
@@ -21,7 +25,8 @@ setup(
     install_requires=install_requires,
     package_data={'audio_degrader': ['resources/impulse_responses/*',
                                      'resources/sounds/*']},
-    scripts=['scripts/audio_degrader'],
+    scripts=['scripts/audio_degrader', 'scripts/audio_degrader_batch',
+             'scripts/audio_degrader_server'],
     include_package_data=True,
     long_description=long_description,
     long_description_content_type='text/markdown'
@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import numpy as np
+import pytest
+import soundfile as sf
+from audio_degrader import BatchDegrader, BatchJob
+from audio_degrader.BatchDegrader import _seed_job
+
+TMP_PATH = './tests/tmp_batch'
+
+
+class TestBatchDegrader:
+
+    def setup_class(self):
+        if not os.path.isdir(TMP_PATH):
+            os.makedirs(TMP_PATH)
+
+    def test_jobs_from_manifest(self):
+        csv_path = os.path.join(TMP_PATH, 'manifest.csv')
+        with open(csv_path, 'w') as f:
+            f.write('input,output,degradations\n')
+            f.write('in/a.wav,out/a.wav,"gain,6 normalize"\n')
+        jsonl_path = os.path.join(TMP_PATH, 'manifest.jsonl')
+        with open(jsonl_path, 'w') as f:
+            f.write(json.dumps({'input': 'in/a.wav',
+                                'output': 'out/a.wav',
+                                'degradations': ['gain,6', 'normalize']}))
+        target_job = BatchJob('in/a.wav', 'out/a.wav', ['gain,6', 'normalize'])
+        assert BatchDegrader.jobs_from_manifest(csv_path) == [target_job]
+        assert BatchDegrader.jobs_from_manifest(jsonl_path) == [target_job]
+
+    def test_jobs_from_directory(self):
+        jobs = BatchDegrader.jobs_from_directory('./tests/test_files',
+                                                 'out',
+                                                 ['gain,6'])
+        input_paths = [job.input_path for job in jobs]
+        assert ('./tests/test_files/test30s_8000_mono_pcm16le.wav'
+                in input_paths)
+        assert all(job.output_path.startswith('out') for job in jobs)
+
+    def test_failures_do_not_abort_batch(self):
+        jobs = [BatchJob(os.path.join(TMP_PATH, 'missing%d.wav' % i),
+                         os.path.join(TMP_PATH, 'out%d.wav' % i),
+                         ['gain,6'])
+                for i in range(3)]
+        batch_degrader = BatchDegrader(TMP_PATH, num_workers=2)
+        results = batch_degrader.run(jobs)
+        assert len(results) == 3
+        assert all(r.error is not None for r in results)
+
+    def test_jobs_are_reseeded(self):
+        state = np.random.get_state()
+        try:
+            draws = []
+            for job_index, seed in [(0, 1), (1, 1), (0, 1), (0, None)]:
+                _seed_job(job_index, seed)
+                draws.append(np.random.rand(4))
+        finally:
+            np.random.set_state(state)
+        assert np.array_equal(draws[0], draws[2])
+        assert not np.array_equal(draws[0], draws[1])
+        assert not np.array_equal(draws[0], draws[3])
+
+    @pytest.mark.skipif(shutil.which('sox') is None,
+                        reason="sox is not installed")
+    def test_mixed_batch(self):
+        input_path = './tests/test_files/test30s_8000_mono_pcm16le.wav'
+        corrupt_path = os.path.join(TMP_PATH, 'corrupt.wav')
+        with open(corrupt_path, 'wb') as f:
+            f.write(b'RIFF\x00\x00\x00\x00WAVEnot audio')
+        jobs = [BatchJob(input_path, os.path.join(TMP_PATH, 'out0.wav'),
+                         ['gain,-6']),
+                BatchJob(corrupt_path, os.path.join(TMP_PATH, 'out1.wav'),
+                         ['gain,-6']),
+                BatchJob(input_path, os.path.join(TMP_PATH, 'out2.wav'),
+                         ['gain,-6', 'normalize'])]
+        results = BatchDegrader(TMP_PATH, num_workers=2).run(jobs)
+        assert [r.error is not None for r in results] == [False, True,
+                                                          False]
+        x, _ = sf.read(input_path)
+        for i in [0, 2]:
+            y, sample_rate = sf.read(jobs[i].output_path)
+            assert sample_rate == 8000
+            assert y.shape == (len(x), 2)
+        assert not os.path.isfile(jobs[1].output_path)
+
+    def teardown_class(self):
+        shutil.rmtree(TMP_PATH)
@@ -2,15 +2,31 @@ import os
 import shutil
 import soundfile as sf
 import numpy as np
+from scipy import signal
+import asyncio
+import importlib.machinery
+import importlib.util
+import io
+import json
 import logging
+import pytest
 from audio_degrader import Degradation, DegradationUsageDocGenerator
 from audio_degrader import DegradationTrim, AudioFile
+from audio_degrader import DegradationTrimSegment
 from audio_degrader import DegradationMp3, DegradationGain, DegradationMix
 from audio_degrader import DegradationResample, DegradationConvolution
 from audio_degrader import DegradationSpeed, DegradationPitchShifting
 from audio_degrader import DegradationTimeStretching
 from audio_degrader import DegradationDynamicRangeCompression
 from audio_degrader import DegradationEqualization
+from audio_degrader import ResourceCache, PartitionedConvolver
+from audio_degrader import PolyphaseResampler, AudioStream
+from audio_degrader import ParametersParser, ChainProfile
+from audio_degrader import Profiler
+from audio_degrader import utils
+from audio_degrader import ChainPlanner, DegradationSoxChain
+from audio_degrader import VariantDegrader, ChainSpec
+from audio_degrader import ParallelExecutor, AsyncDegrader, ResultCache
 
 TEST_STEREO_WAV_PATH = './tests/test_files/test30s_44100_stereo_pcm16le.wav'
 TEST_MONO_WAV_PATH = './tests/test_files/test30s_44100_mono_pcm16le.wav'
@@ -63,6 +79,63 @@ class TestDegradationMp3:
         shutil.rmtree(TMP_PATH)
 
 
+class TestDegradationMp3InMemory:
+    tmp_path = os.path.join(TMP_PATH, 'mp3_in_memory')
+
+    def test_compression_level(self):
+        assert DegradationMp3.get_compression_level(320, 44100) == 0.0
+        assert DegradationMp3.get_compression_level(8, 8000) == 0.999
+        level = DegradationMp3.get_compression_level(32, 16000)
+        assert abs(level - (160 - 32) / 152.0) < 1e-5
+        assert DegradationMp3.get_bitrate_range(48000) == (32, 320)
+        assert DegradationMp3.get_bitrate_range(22050) == (8, 160)
+
+    @pytest.mark.skipif(not DegradationMp3.is_soundfile_supported(),
+                        reason="libsndfile without mp3 support")
+    def test_low_bitrate_keeps_its_bandwidth(self):
+        assert DegradationMp3.get_codec_sample_rate(8, 44100) == 22050
+        assert DegradationMp3.get_codec_sample_rate(32, 48000) == 48000
+        x = np.random.RandomState(0).uniform(-0.3, 0.3, (2, 44100 * 2))
+        bandwidths = {}
+        for bitrate in ['8k', '32k']:
+            degradation_mp3 = DegradationMp3()
+            degradation_mp3.set_parameters_values({'bitrate': bitrate})
+            daf = AudioFile.from_array(x, 44100, self.tmp_path)
+            daf.apply_degradation(degradation_mp3)
+            assert daf.samples.shape == x.shape
+            spectrum = np.abs(np.fft.rfft(daf.samples[0])) ** 2
+            freqs = np.fft.rfftfreq(x.shape[1], 1 / 44100.0)
+            # Highest band of 500 Hz within 30 dB of the first one
+            bands = [spectrum[(freqs >= f) & (freqs < f + 500)].mean()
+                     for f in range(0, 22000, 500)]
+            bandwidths[bitrate] = 500 * max(
+                i for i, b in enumerate(bands) if b > bands[0] * 1e-3)
+        assert bandwidths['8k'] < 3000
+        assert bandwidths['32k'] > 4000
+
+    @pytest.mark.skipif(not DegradationMp3.is_soundfile_supported(),
+                        reason="libsndfile without mp3 support")
+    def test_transcode_with_soundfile(self):
+        t = np.arange(44100 * 3) / 44100.0
+        x = 0.3 * np.vstack((np.sin(2 * np.pi * 300 * t),
+                             np.sin(2 * np.pi * 500 * t)))
+        for bitrate in ['32k', '128k']:
+            degradation_mp3 = DegradationMp3()
+            degradation_mp3.set_parameters_values({'bitrate': bitrate})
+            daf = AudioFile.from_array(x.astype('float32'), 44100,
+                                       self.tmp_path)
+            daf.apply_degradation(degradation_mp3)
+            y = daf.samples
+            assert y.shape == x.shape
+            assert y.dtype == np.float32
+            # Aligned with the input, i.e. delay of the codec is removed
+            errors = [np.mean((np.roll(y[0], lag) - x[0]) ** 2)
+                      for lag in range(-2, 3)]
+            assert np.argmin(errors) == 2
+            assert daf.profile.get_totals()['subprocess_count'] == 0
+            assert not os.path.isdir(self.tmp_path)
+
+
 class TestDegradationGain:
 
     def setup_class(self):
@@ -106,10 +179,41 @@ class TestDegradationMix:
         target_y = target_y.T
         assert np.mean(np.abs(target_y - self.daf.samples)) < 0.001
 
+    def test_noise_offset(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 44100 * 40))
+        degradation_mix = DegradationMix()
+        degradation_mix.set_parameters_values(
+            {'noise': 'sounds/applause.wav', 'snr': 6, 'offset': 0.5})
+        daf = AudioFile.from_array(x, 44100)
+        daf.apply_degradation(degradation_mix)
+        noise = utils.tile(
+            degradation_mix.read_noise(
+                degradation_mix.get_actual_noise_path(), daf),
+            x.shape[1], 22050)
+        g = degradation_mix.get_noise_gain_factor(
+            6, np.sqrt(np.mean(noise ** 2)), np.sqrt(np.mean(x ** 2)))
+        y = x + noise * g
+        y *= np.sqrt(np.mean(x ** 2) / np.mean(y ** 2))
+        assert np.max(np.abs(daf.samples - y)) < 1e-12
+
     def teardown_class(self):
         shutil.rmtree(TMP_PATH)
 
 
+class TestTile:
+
+    def test_tile_matches_modular_indexing(self):
+        x = np.arange(14).reshape(2, 7)
+        for n_samples, offset in [(3, 0), (7, 0), (30, 0), (30, 5), (4, 12)]:
+            y = utils.tile(x, n_samples, offset)
+            indices = (offset + np.arange(n_samples)) % 7
+            assert np.array_equal(y, x[:, indices])
+
+    def test_tile_segments_are_contiguous(self):
+        segments = list(utils.get_tile_segments(10, 25, 8))
+        assert segments == [(0, 8, 2), (2, 0, 10), (12, 0, 10), (22, 0, 3)]
+
+
 class TestDegradationResample:
 
     def setup_class(self):
@@ -271,6 +375,697 @@ class TestDegradationEqualization:
         shutil.rmtree(TMP_PATH)
 
 
+class TestEqualizationFilter:
+
+    def test_gain_at_central_freq(self):
+        degradation_equalization = DegradationEqualization()
+        degradation_equalization.set_parameters_values(
+            {'central_freq': '800',
+             'bandwidth': '10',
+             'gain': '20'})
+        sos = degradation_equalization.get_sos(44100)
+        _, h = signal.sosfreqz(sos, worN=[800], fs=44100)
+        assert np.abs(20 * np.log10(np.abs(h[0])) - 20) < 0.001
+
+
+class TestDynamicRangeCompressionEnvelope:
+
+    def test_envelope_matches_sequential_follower(self):
+        degradation_drcompression = DegradationDynamicRangeCompression()
+        sample_rate = 8000
+        t = np.arange(3 * sample_rate) / float(sample_rate)
+        x_abs = np.abs(np.sin(2 * np.pi * 220 * t) *
+                       np.where(t % 1 < 0.5, 0.8, 0.01))
+        envelope = degradation_drcompression.get_envelope(
+            x_abs, sample_rate, 0.01, 0.2)
+        attack_rate = degradation_drcompression.get_rate(0.01, sample_rate)
+        decay_rate = degradation_drcompression.get_rate(0.2, sample_rate)
+        volume = 1.0
+        for n in range(len(x_abs)):
+            delta = x_abs[n] - volume
+            volume += delta * (attack_rate if delta > 0 else decay_rate)
+            assert np.abs(envelope[n] - volume) < 1e-9
+
+    def test_capped_iterations_fall_back_to_sequential(self):
+        degradation_drcompression = DegradationDynamicRangeCompression()
+        x_abs = np.abs(np.random.RandomState(0).uniform(-1, 1, 4000))
+        envelope = degradation_drcompression.get_envelope(
+            x_abs, 8000, 0.01, 0.2)
+        degradation_drcompression.max_iterations = 1
+        capped = degradation_drcompression.get_envelope(
+            x_abs, 8000, 0.01, 0.2)
+        assert np.max(np.abs(envelope - capped)) < 1e-9
+
+    @pytest.mark.skipif(shutil.which('sox') is None,
+                        reason="sox is not installed")
+    def test_presets_match_sox(self):
+        x, sample_rate = sf.read(TEST_MONO_8K_WAV_PATH)
+        x = x.reshape(1, -1)
+        for degree, sox_args in [
+                ('1', ['0.01,0.20', '-40,-10,-30', '5']),
+                ('2', ['0.01,0.20', '-50,-50,-40,-30,-40,-10,-30', '12']),
+                ('3', ['0.01,0.1', '-70,-60,-70,-30,-70,0,-70', '45'])]:
+            degradation_drcompression = DegradationDynamicRangeCompression()
+            degradation_drcompression.set_parameters_values(
+                {'degree': degree})
+            y, _ = degradation_drcompression.compress(x, sample_rate)
+            target_y = utils.apply_sox_effects(x, sample_rate,
+                                               ['compand'] + sox_args)
+            assert y.shape == target_y.shape
+            # Tolerance of the class docstring
+            assert np.mean(np.abs(y - target_y)) < 1e-3
+
+
+class TestAudioFileInMemory:
+
+    def setup_class(self):
+        logging.basicConfig(level=logging.DEBUG)
+        if not os.path.isdir(TMP_PATH):
+            os.makedirs(TMP_PATH)
+        self.daf = AudioFile(TEST_MONO_WAV_PATH,
+                             TMP_PATH,
+                             in_memory=True)
+
+    def test_mirror_file_written_lazily(self):
+        # wav inputs are decoded by soundfile, without a mirror file
+        assert not os.path.isfile(self.daf.tmp_path)
+        degradation_gain = DegradationGain()
+        degradation_gain.set_parameters_values({'value': -6})
+        self.daf.apply_degradation(degradation_gain)
+        assert not os.path.isfile(self.daf.tmp_path)
+        self.daf.sync_mirror_file()
+        mirror_synced, _ = sf.read(self.daf.tmp_path)
+        assert np.max(np.abs(mirror_synced.T - self.daf.samples)) < 0.001
+
+    def teardown_class(self):
+        shutil.rmtree(TMP_PATH)
+
+
+class TestSoxPipe:
+
+    def test_raw_round_trip(self):
+        x = np.random.RandomState(0).uniform(-1, 1, (2, 1000))
+        raw = utils.samples_to_raw(x)
+        assert len(raw) == x.size * 4
+        y = utils.raw_to_samples(raw, 2)
+        assert y.shape == x.shape
+        assert y.flags.writeable
+        assert np.max(np.abs(x - y)) < 1e-7
+
+    def test_apply_sox_effects_keeps_shape_and_dtype(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 8000))
+        x = x.astype('float32')
+        y = utils.apply_sox_effects(x, 8000, ['gain', '-6'])
+        assert y.shape == x.shape
+        assert y.dtype == x.dtype
+        assert np.max(np.abs(y - x * 10 ** (-6 / 20.0))) < 1e-3
+
+
+class TestChainPlanner:
+
+    def test_plan_fuses_adjacent_sox_degradations(self):
+        degradations = ParametersParser.parse_degradations_args([
+            'speed,0.9', 'pitch_shift,0.95', 'gain,-3', 'time_stretch,1.1',
+            'mp3,64k', 'time_stretch,0.9', 'speed,1.1', 'resample,8000'])
+        planned = ChainPlanner.plan(degradations)
+        assert [d.name for d in planned] == [
+            'sox_chain', 'gain', 'time_stretch', 'mp3', 'sox_chain',
+            'resample']
+        assert planned[0].degradations == degradations[:2]
+        assert planned[4].degradations == degradations[5:7]
+
+    def test_fused_effects_keep_sample_rate(self):
+        chain = DegradationSoxChain(ParametersParser.parse_degradations_args(
+            ['speed,0.9', 'pitch_shift,0.95']))
+        effects, sample_rate = chain.get_sox_effects(8000)
+        assert sample_rate == 8000
+        assert effects[0] == 'speed'
+        assert effects[-1] == '8000.000000'
+
+    @pytest.mark.skipif(shutil.which('sox') is None,
+                        reason="sox is not installed")
+    def test_fused_chain_matches_unfused(self):
+        x, sample_rate = sf.read(TEST_MONO_8K_WAV_PATH)
+        degradations = ParametersParser.parse_degradations_args([
+            'speed,0.9', 'pitch_shift,0.95', 'equalize,100,50,-10',
+            'dr_compression,2'])
+        planned = ChainPlanner.plan(degradations)
+        assert len(planned) < len(degradations)
+        samples = []
+        for chain in [degradations, planned]:
+            daf = AudioFile.from_array(x, sample_rate, TMP_PATH)
+            for degradation in chain:
+                daf.apply_degradation(degradation)
+            samples.append(daf.samples)
+            daf.delete_tmp_files()
+        assert samples[0].shape == samples[1].shape
+        # Only the float32 pipe between sox processes differs
+        assert np.max(np.abs(samples[0] - samples[1])) < 1e-4
+
+
+class TestVariantDegrader:
+
+    def test_degradation_args_round_trip(self):
+        for args in ['gain,6', 'normalize', 'mix,sounds/applause.wav,6']:
+            degradation = ParametersParser.parse_degradation_args(args)
+            assert ParametersParser.get_degradation_args(degradation) == args
+
+    def test_tree_shares_prefixes_and_stacks_siblings(self):
+        root = VariantDegrader.build_tree([
+            ['gain,3', 'mix,sounds/applause.wav,6'],
+            ['gain,3', 'mix,sounds/applause.wav,10'],
+            ['gain,3', 'mix,sounds/hum.wav,10'],
+            ['gain,-3']])
+        assert list(root.children) == ['gain,3', 'gain,-3']
+        groups = VariantDegrader.get_stacks(root.children['gain,3'])
+        assert [len(g) for g in groups] == [2, 1]
+        assert [len(g) for g in VariantDegrader.get_stacks(root)] == [2]
+
+    def test_variants_match_sequential_chains(self):
+        if not os.path.isdir(TMP_PATH):
+            os.makedirs(TMP_PATH)
+        chains = [['gain,3', 'mix,sounds/applause.wav,6'],
+                  ['gain,3', 'mix,sounds/applause.wav,10', 'normalize'],
+                  ['gain,-3'],
+                  ['gain,3']]
+        variant_degrader = VariantDegrader(TEST_MONO_WAV_PATH, TMP_PATH)
+        results = variant_degrader.apply_chains(chains)
+        for chain, (samples, sample_rate) in zip(chains, results):
+            daf = AudioFile(TEST_MONO_WAV_PATH, TMP_PATH, in_memory=True)
+            for degradation in ParametersParser.parse_degradations_args(
+                    chain):
+                daf.apply_degradation(degradation)
+            assert sample_rate == daf.sample_rate
+            assert np.max(np.abs(samples - daf.samples)) < 1e-10
+            daf.delete_tmp_files()
+        variant_degrader.delete_tmp_files()
+        shutil.rmtree(TMP_PATH, ignore_errors=True)
+
+
+class TestChainSpec:
+
+    def test_split_parameters_ignores_nested_separators(self):
+        assert utils.split_parameters('choice(a|b),U(0,20)') == [
+            'choice(a|b)', 'U(0,20)']
+
+    def test_sampling_is_seeded(self):
+        chain_spec = ChainSpec.parse(['gain,U(-12,6)',
+                                      'mix,choice(sounds/*.wav),U(0,20)',
+                                      'resample,choice(8000|16000)',
+                                      'normalize'])
+        noise_choice = chain_spec.degradation_specs[1].values[0]
+        assert 'sounds/applause.wav' in noise_choice.options
+        degradations = chain_spec.sample(np.random.RandomState(1))
+        again = chain_spec.sample(np.random.RandomState(1))
+        args = [ParametersParser.get_degradation_args(d)
+                for d in degradations]
+        assert args == [ParametersParser.get_degradation_args(d)
+                        for d in again]
+        assert -12 <= float(degradations[0].parameters_values['value']) <= 6
+        assert degradations[1].parameters_values['noise'] in \
+            noise_choice.options
+        assert degradations[2].parameters_values['sample_rate'] in [
+            '8000', '16000']
+        assert args[3] == 'normalize'
+
+    def test_generate(self):
+        if not os.path.isdir(TMP_PATH):
+            os.makedirs(TMP_PATH)
+        daf = AudioFile(TEST_MONO_WAV_PATH, TMP_PATH, in_memory=True)
+        chain_spec = ChainSpec.parse(['gain,U(-12,0)'])
+        variants = list(chain_spec.generate(daf, seed=0, n_variants=3))
+        assert len(variants) == 3
+        for samples, args in variants:
+            gain = float(args[0].split(',')[1])
+            expected = daf.samples * 10 ** (gain / 20.0)
+            assert np.max(np.abs(samples - expected)) < 1e-12
+        daf.delete_tmp_files()
+        shutil.rmtree(TMP_PATH, ignore_errors=True)
+
+    def test_random_offset_is_drawn_from_rng(self):
+        daf = AudioFile.from_array(np.random.uniform(-0.5, 0.5, (2, 8000)),
+                                   8000, TMP_PATH)
+        chain_spec = ChainSpec.parse(['mix,sounds/brown-noise.wav,6,random'])
+        variants = []
+        for global_seed in [1, 2]:
+            np.random.seed(global_seed)
+            variants.append(list(chain_spec.generate(daf, seed=0,
+                                                     n_variants=2)))
+        for (samples, args), (again, again_args) in zip(*variants):
+            assert args == again_args
+            assert np.array_equal(samples, again)
+        offsets = [float(args[0].split(',')[3]) for _, args in variants[0]]
+        assert offsets[0] != offsets[1]
+        assert all(offset >= 0 for offset in offsets)
+
+
+class TestProfiler:
+
+    def test_records_go_to_active_stage(self):
+        profile = ChainProfile()
+        Profiler.record_read(10)
+        with profile.stage('gain', {'value': '-6'}):
+            Profiler.record_read(100)
+            Profiler.record_write(50)
+            Profiler.record_subprocess(0.5)
+            Profiler.record_buffer(np.zeros((2, 10)))
+        with profile.stage('mix'):
+            Profiler.record_write(25)
+            Profiler.record_mirror_update(0.25)
+            Profiler.record_buffer(np.zeros((2, 4)))
+        Profiler.record_write(10)
+        stages = profile.to_dict()['stages']
+        assert [s['name'] for s in stages] == ['gain', 'mix']
+        assert stages[0]['bytes_read'] == 100
+        assert stages[0]['subprocess_count'] == 1
+        assert stages[0]['peak_buffer_bytes'] == 160
+        total = profile.get_totals()
+        assert total['bytes_written'] == 75
+        assert total['mirror_update_count'] == 1
+        assert total['peak_buffer_bytes'] == 160
+
+    def test_audio_file_profile(self):
+        if not os.path.isdir(TMP_PATH):
+            os.makedirs(TMP_PATH)
+        daf = AudioFile(TEST_MONO_WAV_PATH, TMP_PATH)
+        degradation_gain = DegradationGain()
+        degradation_gain.set_parameters_values({'value': -6})
+        daf.apply_degradation(degradation_gain)
+        daf.to_wav(os.path.join(TMP_PATH, 'profiled.wav'))
+        stages = daf.profile.to_dict()['stages']
+        assert [s['name'] for s in stages] == ['load', 'gain', 'export']
+        assert stages[0]['subprocess_count'] == 0
+        assert stages[1]['mirror_update_count'] == 1
+        assert stages[1]['parameters'] == {'value': -6}
+        assert stages[1]['peak_buffer_bytes'] == daf.samples.nbytes
+        daf.delete_tmp_files()
+        shutil.rmtree(TMP_PATH)
+
+
+class TestAudioFileFromArray:
+    tmp_path = os.path.join(TMP_PATH, 'from_array')
+
+    def test_numpy_degradations_do_not_touch_disk(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, 16000)
+        daf = AudioFile.from_array(x.astype('float32'), 16000, self.tmp_path)
+        assert daf.samples.shape == (2, 16000)
+        assert daf.dtype == 'float32'
+        for degradation in ParametersParser.parse_degradations_args(
+                ['gain,-3', 'equalize,1000,500,6', 'dr_compression,2',
+                 'normalize', 'trim_from,0.1']):
+            daf.apply_degradation(degradation)
+        y = daf.to_array()
+        assert y.shape == (2, 14400)
+        assert y.dtype == np.float32
+        assert not os.path.isdir(self.tmp_path)
+        assert daf.profile.get_totals()['bytes_written'] == 0
+
+    def test_mirror_file_is_created_lazily(self):
+        x = np.zeros((2, 1000))
+        daf = AudioFile.from_array(x, 8000, self.tmp_path, in_memory=False)
+        assert not os.path.isdir(self.tmp_path)
+        degradation_gain = DegradationGain()
+        degradation_gain.set_parameters_values({'value': -6})
+        daf.apply_degradation(degradation_gain)
+        assert os.path.isfile(daf.tmp_path)
+        daf.delete_tmp_files()
+        assert not os.path.isdir(self.tmp_path)
+
+    def test_invalid_shape(self):
+        with pytest.raises(Exception):
+            AudioFile.from_array(np.zeros((3, 100)), 8000, self.tmp_path)
+
+    def test_in_place_matches_copies(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 16000))
+        x_orig = x.copy()
+        degradations = ParametersParser.parse_degradations_args(
+            ['gain,-3', 'equalize,1000,500,6', 'dr_compression,2',
+             'normalize', 'gain,12'])
+        daf = AudioFile.from_array(x, 16000, self.tmp_path)
+        daf_in_place = AudioFile.from_array(x, 16000, self.tmp_path,
+                                            in_place=True)
+        fork = daf_in_place.fork()
+        for n, degradation in enumerate(degradations):
+            daf.apply_degradation(degradation)
+            daf_in_place.apply_degradation(degradation)
+            if n == 1:
+                buffer = daf_in_place.samples
+            assert np.max(np.abs(daf.samples - daf_in_place.samples)) < 1e-12
+        # Samples of the caller and of forks are never overwritten
+        assert np.array_equal(x, x_orig)
+        assert np.array_equal(fork.samples, x_orig)
+        # After the filter of equalize, the same buffer is reused
+        assert np.shares_memory(buffer, daf_in_place.samples)
+
+
+class TestKeepChannels:
+    tmp_path = os.path.join(TMP_PATH, 'keep_channels')
+
+    def test_mono_matches_stereo(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, 44100)
+        args = ['mix,sounds/hum.wav,6,0.5',
+                'mix,sounds/brown-noise.wav,3',
+                'equalize,1000,500,6', 'dr_compression,2', 'normalize']
+        daf = AudioFile.from_array(x, 44100, self.tmp_path)
+        daf_mono = AudioFile.from_array(x, 44100, self.tmp_path,
+                                        keep_channels=True)
+        assert daf_mono.samples.shape == (1, 44100)
+        for degradation in ParametersParser.parse_degradations_args(args):
+            daf.apply_degradation(degradation)
+            daf_mono.apply_degradation(degradation)
+        assert daf_mono.samples.shape == (1, 44100)
+        assert np.max(np.abs(daf.samples - daf_mono.samples)) < 1e-12
+
+    def test_mono_noise_is_broadcast(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (3, 20000))
+        degradation = ParametersParser.parse_degradation_args(
+            'mix,sounds/brown-noise.wav,0')
+        daf = AudioFile.from_array(x, 16000, self.tmp_path,
+                                   keep_channels=True)
+        noise = degradation.read_noise(degradation.get_actual_noise_path(),
+                                       daf)
+        assert noise.shape[0] == 1
+        daf.apply_degradation(degradation)
+        assert daf.samples.shape == (3, 20000)
+        noise = noise[0, :20000]
+        g = degradation.get_noise_gain_factor(
+            0, np.sqrt(np.mean(noise ** 2)), np.sqrt(np.mean(x ** 2)))
+        y = x + noise * g
+        y *= np.sqrt(np.mean(x ** 2) / np.mean(y ** 2))
+        assert np.max(np.abs(daf.samples - y)) < 1e-12
+        daf.apply_degradation(ParametersParser.parse_degradation_args(
+            'convolution,impulse_responses/ir_smartphone_mic_mono.wav,0.5'))
+        assert daf.samples.shape == (3, 20000)
+
+    def test_to_wav_subtype(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, 8000)
+        daf = AudioFile.from_array(x, 8000, self.tmp_path,
+                                   keep_channels=True)
+        os.makedirs(self.tmp_path, exist_ok=True)
+        output_path = os.path.join(self.tmp_path, 'out.wav')
+        daf.to_wav(output_path, 'PCM_16')
+        info = sf.info(output_path)
+        assert (info.channels, info.subtype) == (1, 'PCM_16')
+        y, _ = sf.read(output_path)
+        assert np.max(np.abs(y - x)) < 1e-4
+        shutil.rmtree(self.tmp_path)
+
+    def test_stream_keeps_mono(self):
+        os.makedirs(self.tmp_path, exist_ok=True)
+        output_path = os.path.join(self.tmp_path, 'stream.wav')
+        audio_stream = AudioStream(TEST_MONO_8K_WAV_PATH, self.tmp_path,
+                                   keep_channels=True, subtype='FLOAT')
+        audio_stream.apply_degradations(
+            ParametersParser.parse_degradations_args(
+                ['mix,sounds/brown-noise.wav,6', 'gain,-6']), output_path)
+        info = sf.info(output_path)
+        assert (info.channels, info.subtype) == (1, 'FLOAT')
+        shutil.rmtree(self.tmp_path)
+
+
+class TestNativeDecode:
+    tmp_path = os.path.join(TMP_PATH, 'native_decode')
+
+    def test_wav_is_read_without_sox(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path, in_memory=True)
+        x, sample_rate = sf.read(TEST_MONO_8K_WAV_PATH)
+        assert daf.sample_rate == sample_rate
+        assert daf.samples.shape == (2, len(x))
+        assert np.array_equal(daf.samples[0], x)
+        assert np.array_equal(daf.samples[1], x)
+        load = daf.profile.to_dict()['stages'][0]
+        assert load['subprocess_count'] == 0
+        assert load['bytes_written'] == 0
+        assert not os.path.isdir(self.tmp_path)
+
+    def test_default_mode_writes_mirror_file_at_load(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path)
+        x, _ = sf.read(TEST_MONO_8K_WAV_PATH)
+        y, _ = sf.read(daf.tmp_path)
+        assert y.shape == (len(x), 2)
+        assert np.max(np.abs(y[:, 0] - x)) < 1e-4
+        load = daf.profile.to_dict()['stages'][0]
+        assert load['subprocess_count'] == 0
+        assert load['mirror_update_count'] == 1
+        daf.delete_tmp_files()
+
+    def test_keep_channels(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, TMP_PATH, in_memory=True,
+                        keep_channels=True)
+        assert daf.samples.shape[0] == 1
+
+    def test_unsupported_inputs_are_left_to_sox(self):
+        daf = AudioFile.from_array(np.zeros(100), 8000, TMP_PATH)
+        daf.audio_path = './tests/test_degradations.py'
+        assert not daf.can_read_natively()
+        daf.audio_path = 'https://example.com/input.mp3'
+        assert not daf.can_read_natively()
+        daf.audio_path = TEST_MONO_8K_WAV_PATH
+        assert daf.can_read_natively()
+
+
+class TestLazyTrim:
+    tmp_path = os.path.join(TMP_PATH, 'lazy_trim')
+
+    def test_leading_trims_decode_only_segment(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path, in_memory=True)
+        for degradation in ParametersParser.parse_degradations_args([
+                'trim_from,1', 'trim_segment,0.5,2.5', 'gain,-6']):
+            daf.apply_degradation(degradation)
+            if degradation.name != 'gain':
+                assert daf._samples is None
+        x, sample_rate = sf.read(TEST_MONO_8K_WAV_PATH, start=12000,
+                                 stop=28000)
+        assert daf.samples.shape == (2, 16000)
+        assert np.max(np.abs(daf.samples[0] - x * 10 ** (-6 / 20.0))) < 1e-12
+        gain = daf.profile.to_dict()['stages'][-1]
+        assert 0 < gain['bytes_read'] < os.path.getsize(TEST_MONO_8K_WAV_PATH)
+
+    def test_trim_is_a_view(self):
+        x = np.random.uniform(-0.5, 0.5, (2, 8000))
+        daf = AudioFile.from_array(x, 8000, self.tmp_path)
+        degradation_segment = DegradationTrimSegment()
+        degradation_segment.set_parameters_values({'start_time': 0.25,
+                                                   'end_time': 2})
+        daf.apply_degradation(degradation_segment)
+        assert not os.path.isdir(self.tmp_path)
+        assert np.may_share_memory(daf.samples, x)
+        assert np.array_equal(daf.samples, x[:, 2000:])
+
+    def test_default_mode_writes_trims(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path)
+        daf.apply_degradation(ParametersParser.parse_degradation_args(
+            'trim_from,1'))
+        x, _ = sf.read(TEST_MONO_8K_WAV_PATH)
+        y, _ = sf.read(daf.tmp_path)
+        assert y.shape == (len(x) - 8000, 2)
+        assert np.max(np.abs(y[:, 0] - x[8000:])) < 1e-4
+        daf.delete_tmp_files()
+
+    def test_stream_trim_segment(self):
+        output_path = os.path.join(self.tmp_path, 'stream.wav')
+        os.makedirs(self.tmp_path, exist_ok=True)
+        degradation_segment = DegradationTrimSegment()
+        degradation_segment.set_parameters_values({'start_time': 0.5,
+                                                   'end_time': 1.75})
+        audio_stream = AudioStream(TEST_MONO_8K_WAV_PATH, self.tmp_path,
+                                   block_size=3000, keep_channels=True)
+        audio_stream.apply_degradations([degradation_segment], output_path)
+        x, _ = sf.read(TEST_MONO_8K_WAV_PATH)
+        y, _ = sf.read(output_path)
+        assert np.max(np.abs(y - x[4000:14000])) < 1e-6
+
+    def teardown_class(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class TestCommandLine:
+    tmp_path = os.path.join(TMP_PATH, 'command_line')
+
+    def setup_class(self):
+        loader = importlib.machinery.SourceFileLoader(
+            'audio_degrader_script', './scripts/audio_degrader')
+        spec = importlib.util.spec_from_loader(loader.name, loader)
+        self.script = importlib.util.module_from_spec(spec)
+        loader.exec_module(self.script)
+
+    def test_chain_is_applied_in_memory(self):
+        output_path = os.path.join(self.tmp_path, 'output.wav')
+        profile_path = os.path.join(self.tmp_path, 'profile.json')
+        os.makedirs(self.tmp_path, exist_ok=True)
+        self.script.main(TEST_MONO_8K_WAV_PATH, self.tmp_path,
+                         ['gain,-3', 'equalize,800,100,6', 'gain,3',
+                          'dr_compression,1', 'normalize'],
+                         output_path, profile_path=profile_path,
+                         keep_channels=True, subtype='FLOAT')
+        with open(profile_path) as f:
+            profile = json.load(f)
+        assert profile['total']['mirror_update_count'] == 0
+        assert profile['total']['subprocess_count'] == 0
+        y, sample_rate = sf.read(output_path)
+        assert sample_rate == 8000
+        assert len(y) == len(sf.read(TEST_MONO_8K_WAV_PATH)[0])
+        assert np.max(np.abs(y)) == pytest.approx(1.0)
+        assert sorted(os.listdir(self.tmp_path)) == ['output.wav',
+                                                     'profile.json']
+
+    def teardown_class(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class TestMemmap:
+    tmp_path = os.path.join(TMP_PATH, 'memmap')
+
+    def setup_class(self):
+        self.degradations = ParametersParser.parse_degradations_args([
+            'gain,-3', 'trim_from,1.5', 'normalize'])
+
+    def test_degradations_work_on_mapped_file(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path, in_place=True,
+                        dtype='float32', memmap=True)
+        mapping = daf._mapping
+        assert isinstance(mapping, np.memmap)
+        reference = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path,
+                              in_memory=True, dtype='float32')
+        for degradation in self.degradations:
+            daf.apply_degradation(degradation)
+            reference.apply_degradation(degradation)
+            assert np.may_share_memory(daf.samples, mapping)
+            # The mean of normalize is summed in another order
+            assert np.max(np.abs(daf.samples - reference.samples)) < 1e-6
+            daf.sync_mirror_file()
+            y, _ = sf.read(daf.tmp_path, dtype='float32', always_2d=True)
+            assert np.array_equal(y.T, daf.samples)
+        output_path = os.path.join(self.tmp_path, 'output.wav')
+        daf.to_wav(output_path)
+        assert not os.path.isfile(daf.tmp_path)
+        assert sf.info(output_path).subtype == 'FLOAT'
+        y, sample_rate = sf.read(output_path, dtype='float32',
+                                 always_2d=True)
+        assert sample_rate == 8000
+        assert y.shape == (reference.samples.shape[1], 2)
+        assert np.max(np.abs(y.T - reference.samples)) < 1e-6
+        assert not daf.samples.flags.writeable
+
+    def test_other_results_are_mapped_again(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path, memmap=True,
+                        keep_channels=True)
+        x = daf.samples
+        daf.apply_degradation(self.degradations[0])
+        assert not np.may_share_memory(daf.samples, x)
+        assert isinstance(daf.samples.base, np.memmap)
+        y, _ = sf.read(daf.tmp_path, always_2d=True)
+        assert y.shape[1] == 1
+        assert np.array_equal(y.T, daf.samples)
+        daf.delete_tmp_files()
+
+    def test_fork_keeps_mapped_samples(self):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path, in_place=True,
+                        memmap=True)
+        x = np.array(daf.samples)
+        fork = daf.fork()
+        fork.apply_degradation(self.degradations[1])
+        fork.apply_degradation(self.degradations[0])
+        assert np.array_equal(daf.samples, x)
+        daf.delete_tmp_files()
+        fork.delete_tmp_files()
+
+    def teardown_class(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class TestResultCache:
+    tmp_path = os.path.join(TMP_PATH, 'result_cache')
+
+    def apply(self, degradations_args, result_cache=None):
+        daf = AudioFile(TEST_MONO_8K_WAV_PATH, self.tmp_path, in_memory=True)
+        degradations = ParametersParser.parse_degradations_args(
+            degradations_args)
+        if result_cache is None:
+            for degradation in degradations:
+                daf.apply_degradation(degradation)
+        else:
+            result_cache.apply_degradations(daf, degradations)
+        return daf
+
+    def test_resumes_from_longest_prefix(self):
+        result_cache = ResultCache(self.tmp_path)
+        chain = ['gain,-3', 'trim_segment,1,5', 'normalize', 'gain,-6']
+        daf = self.apply(chain, result_cache)
+        assert result_cache.misses == 1
+        assert len(os.listdir(self.tmp_path)) == 4
+        chain[-1] = 'gain,-12'
+        daf = self.apply(chain, result_cache)
+        assert result_cache.hits == 1
+        stages = daf.profile.to_dict()['stages']
+        assert [s['name'] for s in stages] == ['load', 'cache_load', 'gain',
+                                               'cache_store']
+        assert len(daf.applied_degradations) == 4
+        assert np.array_equal(daf.samples, self.apply(chain).samples)
+
+    def test_random_steps_are_not_cached(self):
+        result_cache = ResultCache(self.tmp_path)
+        daf = AudioFile.from_array(np.zeros((2, 100)), 8000, self.tmp_path)
+        degradations = ParametersParser.parse_degradations_args([
+            'gain,-3', 'mix,sounds/brown-noise.wav,6,random', 'gain,3'])
+        assert len(result_cache.get_keys(daf, degradations)) == 1
+        other = AudioFile.from_array(np.ones((2, 100)), 8000, self.tmp_path)
+        assert (result_cache.get_keys(daf, degradations) !=
+                result_cache.get_keys(other, degradations))
+        sampled = [d.sample_random_values(np.random.RandomState(0))
+                   for d in degradations]
+        assert not sampled[1].has_random_values()
+        assert len(result_cache.get_keys(daf, sampled)) == 3
+
+    def test_least_recently_used_are_evicted(self):
+        result_cache = ResultCache(os.path.join(self.tmp_path, 'lru'),
+                                   max_bytes=15000)
+        samples = np.zeros((2, 400))
+        for i, key in enumerate(['a', 'b', 'c']):
+            if key == 'c':
+                assert result_cache.load('a') is not None
+            result_cache.store(key, samples, 8000)
+            # Explicit times, as mtime may have a coarse resolution
+            os.utime(result_cache._get_path(key), (i, i))
+        assert result_cache.load('a') is not None
+        assert result_cache.load('b') is None
+        assert result_cache.load('c')[1] == 8000
+
+    def teardown_class(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class TestAudioFileFloat32:
+    """ Compare float32 processing with the default float64 one
+    """
+
+    def setup_class(self):
+        logging.basicConfig(level=logging.DEBUG)
+        if not os.path.isdir(TMP_PATH):
+            os.makedirs(TMP_PATH)
+        self.degradations = ParametersParser.parse_degradations_args([
+            'gain,-3',
+            'mix,sounds/applause.wav,6',
+            'convolution,impulse_responses/ir_classroom_mono.wav,0.7',
+            'equalize,800,100,6',
+            'dr_compression,2',
+            'normalize'])
+        self.daf64 = AudioFile(TEST_MONO_WAV_PATH, TMP_PATH, in_memory=True)
+        self.daf32 = AudioFile(TEST_MONO_WAV_PATH, TMP_PATH, in_memory=True,
+                               dtype='float32')
+
+    def test_float32_matches_float64(self):
+        for degradation in self.degradations:
+            self.daf64.apply_degradation(degradation)
+            self.daf32.apply_degradation(degradation)
+            assert self.daf32.samples.dtype == np.float32
+            assert np.max(np.abs(self.daf32.samples -
+                                 self.daf64.samples)) < 1e-4
+
+    def teardown_class(self):
+        shutil.rmtree(TMP_PATH)
+
+
 class TestDegradationUsageDocGenerator:
 
     def test_degradation_help(self):
@@ -292,3 +1087,240 @@ class TestDegradationUsageDocGenerator:
         logging.debug("\n" + degradation_trim_help)
         logging.debug(target_docstring)
         assert degradation_trim_help == target_docstring
+
+
+class TestResourceCache:
+
+    def test_lru_eviction_and_counters(self):
+        cache = ResourceCache(max_bytes=2 * 8 * 100)
+        cache.get('a', lambda: np.zeros(100))
+        cache.get('b', lambda: np.zeros(100))
+        cache.get('a', lambda: np.zeros(100))
+        cache.get('c', lambda: np.zeros(100))  # evicts 'b'
+        assert cache.hits == 1
+        assert cache.misses == 3
+        assert cache.n_bytes == 2 * 8 * 100
+        cache.get('a', lambda: np.ones(100))
+        assert cache.hits == 2
+        array = cache.get('b', lambda: np.ones(100))
+        assert cache.misses == 4
+        assert not array.flags.writeable
+
+    def test_resource_path_is_not_stale(self):
+        tmp_path = os.path.join(TMP_PATH, 'resource_path')
+        os.makedirs(tmp_path, exist_ok=True)
+        cwd = os.getcwd()
+        try:
+            os.chdir(tmp_path)
+            path = 'sounds/brown-noise.wav'
+            assert utils.resolve_resource_path(path) != path
+            os.makedirs('sounds')
+            open(path, 'wb').close()
+            assert utils.resolve_resource_path(path) == path
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp_path)
+
+
+class TestPartitionedConvolver:
+
+    def setup_class(self):
+        rng = np.random.RandomState(0)
+        self.x = rng.randn(2, 50000)
+        self.ir = rng.randn(1, 3000) * np.exp(-np.arange(3000) / 500.0)
+        self.target_y = np.array([
+            signal.fftconvolve(self.x[c], self.ir[0])[:self.x.shape[1]]
+            for c in range(2)])
+
+    def test_convolve(self):
+        spectra = PartitionedConvolver.get_spectra(self.ir, 1024)
+        y = PartitionedConvolver(spectra, 1024).convolve(self.x)
+        assert np.max(np.abs(y - self.target_y)) < 1e-9
+
+    def test_process_stream(self):
+        spectra = PartitionedConvolver.get_spectra(self.ir, 1024)
+        convolver = PartitionedConvolver(spectra, 1024)
+        y = [convolver.process(self.x[:, start:start + 777])
+             for start in range(0, self.x.shape[1], 777)]
+        y = np.concatenate(y + [convolver.flush()], axis=1)
+        assert np.max(np.abs(y - self.target_y)) < 1e-9
+
+    def test_convolve_parallel(self):
+        spectra = PartitionedConvolver.get_spectra(self.ir, 1024)
+        y = PartitionedConvolver(spectra, 1024).convolve(
+            self.x, ParallelExecutor(8))
+        assert np.max(np.abs(y - self.target_y)) < 1e-9
+
+
+class TestParallelExecutor:
+
+    def test_map_keeps_order(self):
+        executor = ParallelExecutor(4)
+        assert executor.map(lambda i: i * i, range(20)) == [
+            i * i for i in range(20)]
+
+    def test_num_threads_from_environment(self):
+        os.environ[ParallelExecutor.env_var] = '3'
+        try:
+            assert ParallelExecutor().num_threads == 3
+        finally:
+            del os.environ[ParallelExecutor.env_var]
+        assert ParallelExecutor().num_threads == 1
+        assert ParallelExecutor(0).num_threads == os.cpu_count()
+
+    def test_get_blocks(self):
+        executor = ParallelExecutor(4)
+        assert executor.get_blocks(10) == [(0, 3), (3, 6), (6, 9), (9, 10)]
+        assert executor.get_blocks(10, 5) == [(0, 5), (5, 10)]
+        assert executor.get_blocks(10, 1, 2) == [(0, 5), (5, 10)]
+        assert executor.get_blocks(0) == []
+
+    def test_degradations_match_single_thread(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 200000))
+        for args in ['convolution,impulse_responses/ir_classroom_mono.wav,0.7',
+                     'mix,sounds/applause.wav,6,1.5',
+                     'equalize,1000,500,6',
+                     'resample,8000']:
+            degradation = ParametersParser.parse_degradation_args(args)
+            daf = AudioFile.from_array(x, 44100, TMP_PATH, num_threads=1)
+            daf.apply_degradation(degradation)
+            daf_threads = AudioFile.from_array(x, 44100, TMP_PATH,
+                                               num_threads=4)
+            daf_threads.apply_degradation(degradation)
+            assert np.max(np.abs(daf.samples - daf_threads.samples)) < 1e-12
+
+
+class TestAsyncDegrader:
+
+    def test_matches_sync(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 44100))
+        args = ['gain,-3', 'equalize,1000,500,6', 'normalize']
+        degrader = AsyncDegrader(2, tmp_dir=TMP_PATH)
+        daf_async = asyncio.run(degrader.degrade(x, args, 44100))
+        degrader.shutdown()
+        daf = AudioFile.from_array(x, 44100, TMP_PATH)
+        for degradation in ParametersParser.parse_degradations_args(args):
+            daf.apply_degradation(degradation)
+        assert np.max(np.abs(daf_async.samples - daf.samples)) < 1e-12
+        assert [s.name for s in daf_async.profile.stages] == [
+            'gain', 'equalize', 'normalize']
+
+    def test_bytes_round_trip(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (44100, 2))
+        wav = io.BytesIO()
+        sf.write(wav, x, 16000, format='WAV', subtype='FLOAT')
+        degrader = AsyncDegrader(tmp_dir=TMP_PATH)
+        output = asyncio.run(degrader.degrade_to_bytes(
+            wav.getvalue(), ['gain,6'], subtype='FLOAT'))
+        y, sample_rate = sf.read(io.BytesIO(output))
+        assert sample_rate == 16000
+        assert np.max(np.abs(y - x * 10 ** (6 / 20.))) < 1e-6
+
+    def test_backpressure(self):
+        x = np.zeros((2, 100))
+        degrader = AsyncDegrader(1, max_pending=1, tmp_dir=TMP_PATH)
+
+        async def run_three():
+            return await asyncio.gather(
+                *[degrader.degrade(x, ['gain,6'], 8000) for _ in range(3)],
+                return_exceptions=True)
+
+        results = asyncio.run(run_three())
+        assert isinstance(results[0], AudioFile)
+        assert isinstance(results[1], AudioFile)
+        assert isinstance(results[2], Exception)
+        assert degrader.n_pending == 0 and degrader.n_running == 0
+
+    def test_cancellation_releases_slot(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 441000))
+        degrader = AsyncDegrader(1, tmp_dir=TMP_PATH)
+
+        async def cancel_and_retry():
+            task = asyncio.ensure_future(degrader.degrade(
+                x, ['equalize,1000,500,6'] * 20, 44100))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return await degrader.degrade(x[:, :100], ['gain,6'], 44100)
+
+        assert isinstance(asyncio.run(cancel_and_retry()), AudioFile)
+        assert degrader.n_running == 0
+
+
+class TestPolyphaseResampler:
+
+    def test_process_stream(self):
+        x = np.random.RandomState(0).randn(2, 20000)
+        h = PolyphaseResampler.design_filter(80, 441)
+        target_y = signal.resample_poly(x, 80, 441, axis=1, window=h)
+        resampler = PolyphaseResampler(80, 441, h)
+        y = [resampler.process(x[:, start:start + 3001])
+             for start in range(0, x.shape[1], 3001)]
+        y = np.concatenate(y + [resampler.flush()], axis=1)
+        assert y.shape == target_y.shape
+        assert np.max(np.abs(y - target_y)) < 1e-9
+
+    def test_filters_are_cached(self):
+        h = PolyphaseResampler.get_filter(80, 441, 'high')
+        assert PolyphaseResampler.get_filter(80, 441, 'high') is h
+        assert not h.flags.writeable
+        with pytest.raises(Exception):
+            PolyphaseResampler.get_filter(80, 441, 'best')
+
+    def test_telephone_round_trip_in_memory(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 44100))
+        daf = AudioFile.from_array(x, 44100, TMP_PATH)
+        for degradation in ParametersParser.parse_degradations_args(
+                ['resample,8000', 'resample,44100,medium']):
+            daf.apply_degradation(degradation)
+        target_y = signal.resample_poly(
+            signal.resample_poly(
+                x, 80, 441, axis=1,
+                window=PolyphaseResampler.design_filter(80, 441, 'high')),
+            441, 80, axis=1)
+        assert daf.sample_rate == 44100
+        assert daf.samples.shape == x.shape
+        assert np.max(np.abs(daf.samples - target_y)) < 1e-12
+        assert daf.profile.get_totals()['subprocess_count'] == 0
+
+
+class TestAudioStream:
+
+    def setup_class(self):
+        if not os.path.isdir(TMP_PATH):
+            os.makedirs(TMP_PATH)
+
+    def test_stream_gain_and_trim(self):
+        output_path = os.path.join(TMP_PATH, 'stream.wav')
+        degradation_gain = DegradationGain()
+        degradation_gain.set_parameters_values({'value': -6})
+        degradation_trim = DegradationTrim()
+        degradation_trim.set_parameters_values({'start_time': 0.5})
+        audio_stream = AudioStream(TEST_MONO_8K_WAV_PATH, TMP_PATH,
+                                   block_size=3000)
+        audio_stream.apply_degradations([degradation_gain, degradation_trim],
+                                        output_path)
+        x, sample_rate = sf.read(TEST_MONO_8K_WAV_PATH)
+        y, _ = sf.read(output_path)
+        assert y.shape == (len(x) - sample_rate // 2, 2)
+        target_y = x[sample_rate // 2:] * 10 ** (-6 / 20.0)
+        assert np.max(np.abs(y[:, 0] - target_y)) < 1e-6
+        assert np.max(np.abs(y[:, 1] - target_y)) < 1e-6
+
+    def test_stream_float32_matches_float64(self):
+        degradations_args = ['equalize,800,100,6', 'dr_compression,2',
+                             'gain,-3', 'normalize']
+        samples = {}
+        for dtype in ['float64', 'float32']:
+            output_path = os.path.join(TMP_PATH, dtype + '.wav')
+            audio_stream = AudioStream(TEST_MONO_8K_WAV_PATH, TMP_PATH,
+                                       dtype=dtype)
+            audio_stream.apply_degradations(
+                ParametersParser.parse_degradations_args(degradations_args),
+                output_path)
+            samples[dtype], _ = sf.read(output_path)
+        assert np.max(np.abs(samples['float32'] - samples['float64'])) < 1e-4
+
+    def teardown_class(self):
+        shutil.rmtree(TMP_PATH)